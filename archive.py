@@ -0,0 +1,205 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+from datetime import date, datetime, timezone
+from pathlib import Path
+from importlib.util import find_spec
+import itertools
+import logging
+import uuid
+import os
+
+pa: Any = None
+pc: Any = None
+ds: Any = None
+pafs: Any = None
+
+log = logging.getLogger("Archive")
+
+if not log.handlers:
+    log.setLevel(logging.INFO)
+    _ch = logging.StreamHandler()
+    _ch.setFormatter(logging.Formatter("[%(levelname)s] Archive: %(message)s"))
+    log.addHandler(_ch)
+
+ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", str(Path.home() / ".tunglogger" / "archive"))
+ARCHIVE_BATCH_ROWS = int(os.getenv("LOG_ARCHIVE_BATCH_ROWS", "50000"))
+ARCHIVE_ROW_GROUP = int(os.getenv("LOG_ARCHIVE_ROW_GROUP", "100000"))
+ARCHIVE_COMPRESSION = os.getenv("LOG_ARCHIVE_COMPRESSION", "zstd")
+
+ARCHIVE_COLUMNS = ("id", "log_type", "log_message", "hostname", "created_at")
+
+def archive_available() -> bool:
+    return pa is not None or find_spec("pyarrow") is not None
+
+def _require() -> None:
+    global pa, pc, ds, pafs
+    if pa is not None:
+        return
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.fs
+    except ImportError:
+        raise RuntimeError("The log archive requires the 'pyarrow' package!") from None
+    pa, pc, ds, pafs = pyarrow, pyarrow.compute, pyarrow.dataset, pyarrow.fs
+
+def _file_schema() -> "pa.Schema":
+    return pa.schema([
+        ("id", pa.int64()),
+        ("log_message", pa.string()),
+        ("hostname", pa.dictionary(pa.int32(), pa.string())),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+        ("day", pa.date32()),
+        ("log_type", pa.string()),
+    ])
+
+def _partitioning() -> "ds.Partitioning":
+    return ds.partitioning(pa.schema([("day", pa.date32()), ("log_type", pa.string())]), flavor="hive")
+
+def _read_partitioning() -> "ds.PartitioningFactory":
+    return ds.HivePartitioning.discover(schema=pa.schema([("day", pa.date32()), ("log_type", pa.string())]), infer_dictionary=True)
+
+def _utc(ts: datetime) -> datetime:
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+def _batches(rows: Iterable[Dict[str, Any]], batch_rows: int, counter: List[int]) -> Iterator["pa.RecordBatch"]:
+    schema = _file_schema()
+    it = iter(rows)
+    while True:
+        chunk = list(itertools.islice(it, batch_rows))
+        if not chunk:
+            return
+        created = [_utc(r["created_at"]) for r in chunk]
+        counter[0] += len(chunk)
+        counter[1] = max(counter[1], max(r["id"] for r in chunk))
+        yield pa.RecordBatch.from_arrays([
+            pa.array([r["id"] for r in chunk], pa.int64()),
+            pa.array([r["log_message"] for r in chunk], pa.string()),
+            pa.array([r["hostname"] for r in chunk], pa.string()).dictionary_encode(),
+            pa.array(created, pa.timestamp("us", tz="UTC")),
+            pa.array([c.date() for c in created], pa.date32()),
+            pa.array([r["log_type"] for r in chunk], pa.string()),
+        ], schema=schema)
+
+def write_archive(
+    rows: Iterable[Dict[str, Any]],
+    root: str = ARCHIVE_DIR,
+    batch_rows: int = ARCHIVE_BATCH_ROWS,
+    tag: Optional[str] = None,
+) -> Dict[str, int]:
+    _require()
+    Path(root).mkdir(parents=True, exist_ok=True)
+    counter = [0, 0]
+    ds.write_dataset(
+        _batches(rows, max(1, batch_rows), counter),
+        root,
+        schema=_file_schema(),
+        format="parquet",
+        partitioning=_partitioning(),
+        basename_template=f"part-{tag or uuid.uuid4().hex}-{{i}}.parquet", #a fixed tag makes reruns overwrite their own files
+        use_threads=False,
+        existing_data_behavior="overwrite_or_ignore",
+        file_options=ds.ParquetFileFormat().make_write_options(compression=ARCHIVE_COMPRESSION, use_dictionary=True),
+        max_rows_per_group=ARCHIVE_ROW_GROUP,
+        min_rows_per_group=min(ARCHIVE_ROW_GROUP, max(1, batch_rows)),
+    )
+    log.info("Archived %d logs to %s.", counter[0], root)
+    return {"rows": counter[0], "max_id": counter[1]}
+
+def _dedupe(table: "pa.Table") -> "pa.Table":
+    keys = ["id", "created_at"]
+    grouped = table.group_by(keys, use_threads=False).aggregate([(c, "first") for c in table.column_names if c not in keys])
+    return grouped.rename_columns([c[:-len("_first")] if c.endswith("_first") else c for c in grouped.column_names]).select(table.column_names)
+
+class ArchiveReader:
+    def __init__(self, root: str = ARCHIVE_DIR) -> None:
+        _require()
+        self.root = Path(root)
+        self._fs = pafs.LocalFileSystem(use_mmap=True)
+
+    def _dataset(self) -> Optional["ds.Dataset"]:
+        if not self.root.is_dir() or next(self.root.rglob("*.parquet"), None) is None:
+            return None
+        return ds.dataset(str(self.root), format="parquet", partitioning=_read_partitioning(), filesystem=self._fs)
+
+    @staticmethod
+    def _filter(
+        types: Optional[Sequence[str]],
+        hosts: Optional[Sequence[str]],
+        since: Optional[datetime],
+        until: Optional[datetime],
+        text: Optional[str],
+    ) -> Optional["ds.Expression"]:
+        exprs: List[ds.Expression] = []
+        if types:
+            exprs.append(ds.field("log_type").isin(list(types)))
+        if hosts:
+            exprs.append(ds.field("hostname").isin(list(hosts)))
+        if since is not None:
+            since = _utc(since)
+            exprs.append(ds.field("day") >= pa.scalar(since.date(), pa.date32()))
+            exprs.append(ds.field("created_at") >= pa.scalar(since, pa.timestamp("us", tz="UTC")))
+        if until is not None:
+            until = _utc(until)
+            exprs.append(ds.field("day") <= pa.scalar(until.date(), pa.date32()))
+            exprs.append(ds.field("created_at") < pa.scalar(until, pa.timestamp("us", tz="UTC")))
+        if text:
+            exprs.append(pc.match_substring(ds.field("log_message"), text, ignore_case=True))
+        if not exprs:
+            return None
+        expr = exprs[0]
+        for e in exprs[1:]:
+            expr = expr & e
+        return expr
+
+    def query(
+        self,
+        types: Optional[Sequence[str]] = None,
+        hosts: Optional[Sequence[str]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        text: Optional[str] = None,
+        limit: int = 1000,
+    ) -> List[Dict[str, Any]]:
+        dataset = self._dataset()
+        if dataset is None or limit <= 0:
+            return []
+        expr = self._filter(types, hosts, since, until, text)
+        by_day: Dict[date, List[ds.Fragment]] = {}
+        for frag in dataset.get_fragments(filter=expr):
+            by_day.setdefault(ds.get_partition_keys(frag.partition_expression)["day"], []).append(frag)
+
+        best: Optional[pa.Table] = None
+        order = [("created_at", "descending"), ("id", "descending")]
+        for day in sorted(by_day, reverse=True):
+            if best is not None and best.num_rows >= limit:
+                break
+            for frag in by_day[day]:
+                for batch in frag.to_batches(schema=dataset.schema, columns=list(ARCHIVE_COLUMNS), filter=expr):
+                    if not batch.num_rows:
+                        continue
+                    table = pa.Table.from_batches([batch])
+                    table = table.cast(pa.schema([(f.name, f.type.value_type if pa.types.is_dictionary(f.type) else f.type) for f in table.schema]))
+                    best = table if best is None else pa.concat_tables([best, table])
+                    if best.num_rows > limit:
+                        best = _dedupe(best)
+                        best = best.take(pc.select_k_unstable(best, min(limit, best.num_rows), order))
+        if best is None:
+            return []
+        best = _dedupe(best)
+        best = best.take(pc.sort_indices(best, order))
+        return best.to_pylist()
+
+    def stats(self) -> Dict[str, Any]:
+        dataset = self._dataset()
+        if dataset is None:
+            return {"files": 0, "rows": 0, "bytes": 0, "days": 0}
+        files = dataset.files
+        days = {ds.get_partition_keys(f.partition_expression)["day"] for f in dataset.get_fragments()}
+        return {
+            "files": len(files),
+            "rows": dataset.count_rows(),
+            "bytes": sum(os.path.getsize(f) for f in files),
+            "days": len(days),
+        }
@@ -0,0 +1,131 @@
+from __future__ import annotations
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import itertools
+import logging
+import re
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+from database import (
+    PGDATABASE, PGUSER, PGPASSWORD, PGHOST, PGPORT, PGSSLMODE, PG_MINCONN, PG_MAXCONN, PG_POOL_TIMEOUT, PG_ITERSIZE,
+    build_fetch_query, LogQuery, TEMPLATE_MINER, FETCH_CACHE,
+)
+from templates import TEMPLATES_ENABLED, TEMPLATE_LOOKUP_SQL
+
+logger = logging.getLogger("db")
+
+_SSL_MODES = ("disable", "allow", "prefer", "require", "verify-ca", "verify-full")
+_PLACEHOLDER = re.compile(r"%s")
+
+_APOOL: Optional["asyncpg.Pool"] = None
+_APOOL_LOCK: Optional[asyncio.Lock] = None
+
+def _to_asyncpg(query: str) -> str:
+    counter = itertools.count(1)
+    return _PLACEHOLDER.sub(lambda _: f"${next(counter)}", query)
+
+async def _ensure_apool() -> "asyncpg.Pool":
+    global _APOOL, _APOOL_LOCK
+    if _APOOL is not None:
+        return _APOOL
+    if asyncpg is None:
+        raise RuntimeError("The async database backend requires the 'asyncpg' package!")
+    if _APOOL_LOCK is None:
+        _APOOL_LOCK = asyncio.Lock()
+    async with _APOOL_LOCK:
+        if _APOOL is None:
+            try:
+                _APOOL = await asyncpg.create_pool(
+                    host=PGHOST,
+                    port=PGPORT,
+                    user=PGUSER,
+                    password=PGPASSWORD,
+                    database=PGDATABASE,
+                    ssl=PGSSLMODE if PGSSLMODE in _SSL_MODES else None,
+                    min_size=PG_MINCONN,
+                    max_size=PG_MAXCONN,
+                )
+                logger.info("Async database pool successfully initialized!")
+            except Exception as e:
+                logger.error("Failed to initialize async pool: %s!", e)
+                raise
+    return _APOOL
+
+async def async_close_pool() -> None:
+    global _APOOL
+    if _APOOL is not None:
+        await _APOOL.close()
+        _APOOL = None
+
+def async_pool_stats() -> Dict[str, Any]:
+    if _APOOL is None:
+        return {"size": PG_MAXCONN, "in_use": 0, "idle": 0}
+    size = _APOOL.get_size()
+    idle = _APOOL.get_idle_size()
+    return {"size": size, "in_use": size - idle, "idle": idle}
+
+async def async_insert_logs_bulk(rows: Sequence[Tuple[str, str, str, Any]]) -> int:
+    if not rows:
+        return 0
+    pool = await _ensure_apool()
+    async with pool.acquire(timeout=PG_POOL_TIMEOUT) as conn:
+        columns: Tuple[str, ...] = ("log_type", "log_message", "hostname", "created_at")
+        records: Sequence[Sequence[Any]] = rows
+        if TEMPLATES_ENABLED:
+            extracted = TEMPLATE_MINER.extract_rows(rows)
+            missing = TEMPLATE_MINER.missing(extracted)
+            if missing:
+                found = await conn.fetch(_to_asyncpg(TEMPLATE_LOOKUP_SQL), missing, missing)
+                TEMPLATE_MINER.remember((r["id"], r["template"]) for r in found)
+            columns += ("template_id", "params")
+            records = TEMPLATE_MINER.encode(rows, extracted)
+        await conn.copy_records_to_table("logs", records=records, columns=columns)
+    FETCH_CACHE.invalidate()
+    return len(rows)
+
+async def async_fetch_logs(
+    log_types: Optional[Sequence[str]] = None,
+    limit: int = 500,
+    before_created_at: Any = None,
+    before_id: Optional[int] = None,
+    since: Any = None,
+    until: Any = None,
+    hosts: Optional[Sequence[str]] = None,
+) -> List[Dict[str, Any]]:
+    query, params = build_fetch_query(log_types, before_created_at, before_id, since, until, hosts=hosts)
+    pool = await _ensure_apool()
+    async with pool.acquire(timeout=PG_POOL_TIMEOUT) as conn:
+        rows = await conn.fetch(_to_asyncpg(query + " LIMIT %s"), *params, limit)
+    return [dict(r) for r in rows]
+
+async def async_query_logs(q: LogQuery) -> List[Dict[str, Any]]:
+    query, params = q.compile()
+    pool = await _ensure_apool()
+    async with pool.acquire(timeout=PG_POOL_TIMEOUT) as conn:
+        try:
+            rows = await conn.fetch(_to_asyncpg(query), *params)
+        except asyncpg.InvalidRegularExpressionError as e:
+            raise ValueError(f"Invalid regex: {e}") from None
+    return [dict(r) for r in rows]
+
+async def async_iter_logs(
+    log_types: Optional[Sequence[str]] = None,
+    since: Any = None,
+    until: Any = None,
+    hosts: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None,
+    prefetch: int = PG_ITERSIZE,
+) -> AsyncIterator[Dict[str, Any]]:
+    query, params = build_fetch_query(log_types, None, None, since, until, hosts=hosts)
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    pool = await _ensure_apool()
+    async with pool.acquire(timeout=PG_POOL_TIMEOUT) as conn:
+        async with conn.transaction(readonly=True):
+            async for row in conn.cursor(_to_asyncpg(query), *params, prefetch=max(1, prefetch)):
+                yield dict(row)
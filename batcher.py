@@ -0,0 +1,206 @@
+from __future__ import annotations
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import Future
+import threading
+import asyncio
+import logging
+import queue
+import time
+import os
+from metrics import observe, inc, SIZE_BUCKETS
+
+log = logging.getLogger("Batcher")
+
+if not log.handlers:
+    log.setLevel(logging.INFO)
+    _ch = logging.StreamHandler()
+    _ch.setFormatter(logging.Formatter("[%(levelname)s] Batcher: %(message)s"))
+    log.addHandler(_ch)
+
+BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+BATCH_INTERVAL = float(os.getenv("LOG_BATCH_INTERVAL", "0.5"))
+BATCH_QUEUE_SIZE = int(os.getenv("LOG_BATCH_QUEUE_SIZE", "10000"))
+
+Row = Tuple[str, str, str, Any]
+WriteFn = Callable[[Sequence[Row]], List[Dict[str, Any]]]
+AsyncWriteFn = Callable[[Sequence[Row]], Awaitable[int]]
+
+_FLUSH = object()
+_STOP = object()
+
+class BatchWriter:
+    def __init__(
+        self,
+        write: WriteFn,
+        batch_size: int = BATCH_SIZE,
+        interval: float = BATCH_INTERVAL,
+        max_queue: int = BATCH_QUEUE_SIZE,
+    ) -> None:
+        self._write = write
+        self.batch_size = max(1, batch_size)
+        self.interval = max(0.0, interval)
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(0, max_queue))
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="log-batch-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, row: Row, timeout: Optional[float] = None) -> "Future[Dict[str, Any]]":
+        if self._closed:
+            raise RuntimeError("BatchWriter is closed!")
+        fut: "Future[Dict[str, Any]]" = Future()
+        try:
+            self._queue.put((row, fut), block=True, timeout=timeout)
+        except queue.Full:
+            raise TimeoutError("Log queue is full, write rejected!") from None
+        return fut
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        if self._closed:
+            return
+        done: "Future[None]" = Future()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            self._queue.put((_FLUSH, done), block=True, timeout=timeout)
+        except queue.Full:
+            raise TimeoutError("Log queue is full, flush timed out!") from None
+        done.result(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            self._queue.put((_STOP, None), block=True, timeout=timeout)
+        except queue.Full:
+            self._closed = False #nothing told the worker to stop, so close can be retried
+            raise TimeoutError("Log queue is full, close timed out!") from None
+        self._thread.join(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def _run(self) -> None:
+        batch: List[Tuple[Row, Future]] = []
+        deadline: Optional[float] = None
+        while True:
+            wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item, fut = self._queue.get(timeout=wait)
+            except queue.Empty:
+                self._write_batch(batch)
+                batch, deadline = [], None
+                continue
+
+            if item is _FLUSH or item is _STOP:
+                self._write_batch(batch)
+                batch, deadline = [], None
+                if item is _STOP:
+                    return
+                fut.set_result(None)
+                continue
+
+            batch.append((item, fut))
+            if deadline is None:
+                deadline = time.monotonic() + self.interval
+            if len(batch) >= self.batch_size:
+                self._write_batch(batch)
+                batch, deadline = [], None
+
+    def _write_batch(self, batch: List[Tuple[Row, Future]]) -> None:
+        if not batch:
+            return
+        observe("batch_rows", len(batch), SIZE_BUCKETS, writer="sync")
+        try:
+            rows = self._write([row for row, _ in batch])
+        except Exception as e:
+            inc("batch_failures_total", writer="sync")
+            log.error("Batch write of %d logs failed: %s", len(batch), e)
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        if len(rows) != len(batch):
+            err = RuntimeError(f"Batch insert returned {len(rows)} rows for {len(batch)} logs!")
+            for _, fut in batch:
+                fut.set_exception(err)
+            return
+        for (_, fut), row in zip(batch, rows):
+            fut.set_result(row)
+
+class AsyncBatchWriter:
+    def __init__(
+        self,
+        write: AsyncWriteFn,
+        batch_size: int = BATCH_SIZE,
+        interval: float = BATCH_INTERVAL,
+        max_queue: int = BATCH_QUEUE_SIZE,
+    ) -> None:
+        self._write = write
+        self.batch_size = max(1, batch_size)
+        self.interval = max(0.0, interval)
+        self.max_queue = max(0, max_queue)
+        self._queue: Optional["asyncio.Queue[Any]"] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit_many(self, rows: Sequence[Row]) -> int:
+        if not rows:
+            return 0
+        if self._task is None or self._queue is None:
+            raise RuntimeError("AsyncBatchWriter is not started!")
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((rows, fut))
+        return await fut
+
+    async def close(self) -> None:
+        if self._task is None or self._queue is None:
+            return
+        await self._queue.put((_STOP, None))
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        assert self._queue is not None
+        while True:
+            item, fut = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [(item, fut)]
+            size = len(item)
+            deadline = loop.time() + self.interval
+            stop = False
+            while size < self.batch_size:
+                try:
+                    item, fut = await asyncio.wait_for(self._queue.get(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append((item, fut))
+                size += len(item)
+            await self._write_batch(batch)
+            if stop:
+                return
+
+    async def _write_batch(self, batch: List[Tuple[Sequence[Row], "asyncio.Future[int]"]]) -> None:
+        rows = [row for chunk, _ in batch for row in chunk]
+        observe("batch_rows", len(rows), SIZE_BUCKETS, writer="async")
+        try:
+            await self._write(rows)
+        except Exception as e:
+            inc("batch_failures_total", writer="async")
+            log.error("Async batch write of %d logs failed: %s", len(rows), e)
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for chunk, fut in batch:
+            if not fut.done():
+                fut.set_result(len(chunk))
@@ -0,0 +1,331 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from pathlib import Path
+import argparse
+import platform
+import tempfile
+import threading
+import random
+import json
+import time
+import sys
+import os
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from database import (
+    init_db, insert_log_row, insert_logs_bulk, copy_logs, fetch_logs, iter_logs, search_logs, reset_log_table, get_conn,
+    partitioning_enabled, PG_COPY_THRESHOLD,
+)
+from templates import TEMPLATES_ENABLED
+from logger import VALID_LOG_TYPES
+
+PATHS = ("insert_row", "insert_bulk", "copy", "fetch", "page", "iter", "search", "export", "api_post", "api_get")
+RESULTS_DIR = Path(os.getenv("BENCH_RESULTS_DIR", "bench_results"))
+
+_TYPE_WEIGHTS = (("INFO", 70), ("DEBUG", 15), ("WARNING", 10), ("ERROR", 5))
+_MESSAGES = (
+    "user {n} logged in from 10.0.{a}.{b}",
+    "request GET /api/items/{n} completed in {ms} ms",
+    "cache miss for key session:{n}",
+    "payment {n} failed: card declined (code {a})",
+    "worker {a} picked job {n} from queue default",
+    "disk usage on /dev/sda{a} at {b}%",
+    "retrying connection to db-{a}.internal ({b}/5)",
+    "config reloaded",
+)
+
+def generate_rows(count: int, seed: int = 42, hosts: int = 8, days: int = 30) -> Iterator[Tuple[str, str, str, datetime]]:
+    rnd = random.Random(seed)
+    types = [t for t, w in _TYPE_WEIGHTS for _ in range(w)]
+    hostnames = [f"bench-host-{i:02d}" for i in range(max(1, hosts))]
+    end = datetime.now(timezone.utc)
+    step = timedelta(days=days) / max(1, count)
+    start = end - timedelta(days=days)
+    for i in range(count):
+        msg = rnd.choice(_MESSAGES).format(n=rnd.randrange(1_000_000), a=rnd.randrange(256), b=rnd.randrange(100), ms=rnd.randrange(2000))
+        yield (rnd.choice(types), msg, rnd.choice(hostnames), start + step * i)
+
+class RssSampler:
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open("/proc/self/statm", "rb") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            if resource is None:
+                return 0
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return rss if sys.platform == "darwin" else rss * 1024
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self) -> "RssSampler":
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._run, name="bench-rss", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+def _percentile(samples: Sequence[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+def measure(name: str, body: Callable[[List[float]], int]) -> Dict[str, Any]:
+    latencies: List[float] = []
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        rows = body(latencies)
+        elapsed = time.perf_counter() - start
+    result = {
+        "rows": rows,
+        "ops": len(latencies),
+        "seconds": round(elapsed, 4),
+        "rows_per_s": round(rows / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1),
+    }
+    print(f"{name:<12} {rows:>10} rows {result['rows_per_s']:>12.1f} rows/s  p50 {result['p50_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms  rss {result['peak_rss_mb']:>7.1f} MB")
+    return result
+
+def _timed(latencies: List[float], fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    t = time.perf_counter()
+    out = fn(*args, **kwargs)
+    latencies.append(time.perf_counter() - t)
+    return out
+
+def bench_insert_row(args: argparse.Namespace) -> Callable[[List[float]], int]:
+    def body(lat: List[float]) -> int:
+        n = 0
+        for t, m, h, c in generate_rows(args.row_ops, args.seed + 1):
+            _timed(lat, insert_log_row, t, m, h, c)
+            n += 1
+        return n
+    return body
+
+def bench_insert_bulk(args: argparse.Namespace) -> Callable[[List[float]], int]:
+    batch = min(args.batch, PG_COPY_THRESHOLD - 1)
+    def body(lat: List[float]) -> int:
+        it = generate_rows(args.bulk_rows, args.seed + 2)
+        n = 0
+        while True:
+            chunk = list(islice(it, batch))
+            if not chunk:
+                return n
+            n += _timed(lat, insert_logs_bulk, chunk)
+    return body
+
+def bench_copy(args: argparse.Namespace) -> Callable[[List[float]], int]:
+    def body(lat: List[float]) -> int:
+        return _timed(lat, copy_logs, generate_rows(args.rows, args.seed))
+    return body
+
+def bench_fetch(args: argparse.Namespace) -> Callable[[List[float]], int]:
+    def body(lat: List[float]) -> int:
+        n = 0
+        for i in range(args.query_ops):
+            types = [VALID_LOG_TYPES[i % len(VALID_LOG_TYPES)]] if i % 2 else None
+            n += len(_timed(lat, fetch_logs, types, 500))
+        return n
+    return body
+
+def bench_page(args: argparse.Namespace) -> Callable[[List[float]], int]:
+    def body(lat: List[float]) -> int:
+        n, cursor = 0, (None, None)
+        while True:
+            rows = _timed(lat, fetch_logs, None, args.page, *cursor)
+            n += len(rows)
+            if len(rows) < args.page or n >= args.rows:
+                return n
+            cursor = (rows[-1]["created_at"], rows[-1]["id"])
+    return body
+
+def bench_iter(args: argparse.Namespace) -> Callable[[List[float]], int]:
+    def body(lat: List[float]) -> int:
+        n = 0
+        t = time.perf_counter()
+        for _ in iter_logs(limit=args.rows):
+            n += 1
+            if n % 10000 == 0:
+                now = time.perf_counter()
+                lat.append(now - t)
+                t = now
+        return n
+    return body
+
+def bench_search(args: argparse.Namespace) -> Callable[[List[float]], int]:
+    queries = (("logged", "text"), ("payment failed", "text"), ("session:12", "substring"), ("db-1[0-9]\\.internal", "regex"))
+    def body(lat: List[float]) -> int:
+        n = 0
+        for i in range(args.query_ops):
+            q, mode = queries[i % len(queries)]
+            n += len(_timed(lat, search_logs, q, None, None, None, 100, mode))
+        return n
+    return body
+
+def bench_export(args: argparse.Namespace) -> Callable[[List[float]], int]:
+    from save import export_json, export_ndjson, export_csv, export_pdf, export_docx
+    exporters = [("json", export_json, args.rows), ("ndjson", export_ndjson, args.rows), ("csv", export_csv, args.rows),
+                 ("pdf", export_pdf, min(args.rows, args.doc_rows)), ("docx", export_docx, min(args.rows, args.doc_rows))]
+    def body(lat: List[float]) -> int:
+        n = 0
+        with tempfile.TemporaryDirectory(prefix="tl-bench-") as tmp:
+            for ext, fn, limit in exporters:
+                n += _timed(lat, fn, iter_logs(limit=limit), str(Path(tmp) / f"bench.{ext}"))
+        return n
+    return body
+
+def _client() -> Any:
+    from fastapi.testclient import TestClient
+    from server_api import app
+    return TestClient(app)
+
+def bench_api_post(args: argparse.Namespace) -> Callable[[List[float]], int]:
+    from concurrent.futures import ThreadPoolExecutor
+
+    def body(lat: List[float]) -> int:
+        it = generate_rows(args.api_rows, args.seed + 3)
+        payloads = []
+        while True:
+            chunk = list(islice(it, 100))
+            if not chunk:
+                break
+            payloads.append([{"log_type": t, "log_message": m, "hostname": h, "created_at": c.isoformat()} for t, m, h, c in chunk])
+        with _client() as client:
+            def post(payload: List[Dict[str, Any]]) -> int:
+                respons = _timed(lat, client.post, "/api/logs", json=payload)
+                respons.raise_for_status()
+                return respons.json()["inserted"]
+            with ThreadPoolExecutor(max_workers=max(1, args.api_concurrency)) as pool:
+                return sum(pool.map(post, payloads))
+    return body
+
+def bench_api_get(args: argparse.Namespace) -> Callable[[List[float]], int]:
+    def body(lat: List[float]) -> int:
+        n = 0
+        with _client() as client:
+            params: Dict[str, Any] = {"limit": args.page}
+            for _ in range(args.query_ops):
+                respons = _timed(lat, client.get, "/api/logs", params=params)
+                respons.raise_for_status()
+                n += len(respons.json())
+                cursor = respons.headers.get("X-Next-Cursor")
+                params = {"limit": args.page, "cursor": cursor} if cursor else {"limit": args.page}
+        return n
+    return body
+
+BENCHES: Dict[str, Callable[[argparse.Namespace], Callable[[List[float]], int]]] = {
+    "insert_row": bench_insert_row,
+    "insert_bulk": bench_insert_bulk,
+    "copy": bench_copy,
+    "fetch": bench_fetch,
+    "page": bench_page,
+    "iter": bench_iter,
+    "search": bench_search,
+    "export": bench_export,
+    "api_post": bench_api_post,
+    "api_get": bench_api_get,
+}
+
+def _server_version() -> str:
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("SHOW server_version;")
+        return cur.fetchone()["server_version"]
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    print(f"\nCompared to {baseline_path} ({baseline['meta'].get('timestamp')}):")
+    for name, res in current["results"].items():
+        old = baseline["results"].get(name)
+        if not old or "rows_per_s" not in res or not old.get("rows_per_s"):
+            continue
+        tput = (res["rows_per_s"] / old["rows_per_s"] - 1) * 100
+        p99 = (res["p99_ms"] / old["p99_ms"] - 1) * 100 if old.get("p99_ms") else 0.0
+        print(f"{name:<12} throughput {tput:+7.1f}%  p99 {p99:+7.1f}%")
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="TungLogger benchmarks. Runs against the configured PG* database and TRUNCATEs the logs table.")
+    ap.add_argument("--rows", type=int, default=10_000, help="dataset size loaded with COPY (10k to 10M)")
+    ap.add_argument("--paths", default=",".join(PATHS), help=f"comma separated subset of: {', '.join(PATHS)}")
+    ap.add_argument("--row-ops", type=int, default=1000, help="single-row inserts for insert_row")
+    ap.add_argument("--bulk-rows", type=int, default=50_000, help="rows inserted by insert_bulk")
+    ap.add_argument("--batch", type=int, default=1000, help="rows per insert_bulk call")
+    ap.add_argument("--api-rows", type=int, default=10_000, help="rows posted by api_post")
+    ap.add_argument("--api-concurrency", type=int, default=8, help="concurrent clients for api_post")
+    ap.add_argument("--query-ops", type=int, default=200, help="calls for fetch, search and api_get")
+    ap.add_argument("--page", type=int, default=1000, help="page size for page and api_get")
+    ap.add_argument("--doc-rows", type=int, default=5000, help="row cap for the PDF and DOCX exports")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="result file (default: bench_results/<timestamp>.json)")
+    ap.add_argument("--compare", help="earlier result file to compare against")
+    ap.add_argument("--yes", action="store_true", help="confirm the target database is a throwaway one")
+    args = ap.parse_args(argv)
+
+    selected = [p.strip() for p in args.paths.split(",") if p.strip()]
+    unknown = [p for p in selected if p not in BENCHES]
+    if unknown:
+        ap.error(f"unknown paths: {', '.join(unknown)}")
+    if not args.yes:
+        ap.error("benchmarks truncate the logs table; pass --yes to run against a throwaway database")
+
+    init_db()
+    reset_log_table()
+    if "copy" not in selected:
+        copy_logs(generate_rows(args.rows, args.seed))
+
+    results: Dict[str, Any] = {}
+    for name in PATHS:
+        if name not in selected:
+            continue
+        try:
+            results[name] = measure(name, BENCHES[name](args))
+        except ImportError as e:
+            print(f"{name:<12} skipped: {e}")
+            results[name] = {"skipped": str(e)}
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "rows": args.rows,
+            "seed": args.seed,
+            "args": vars(args),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "postgres": _server_version(),
+            "partitioned": partitioning_enabled(),
+            "templates": TEMPLATES_ENABLED,
+        },
+        "results": results,
+    }
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2, default=str), encoding="utf-8")
+    print(f"\nResults written to {out}")
+    if args.compare:
+        compare(report, args.compare)
+    reset_log_table()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
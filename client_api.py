@@ -1,26 +1,258 @@
 from __future__ import annotations
-from typing import Tuple, List, Dict, Any
-import requests
+from typing import TYPE_CHECKING, Tuple, List, Dict, Any, Iterable, Iterator, Optional, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+import threading
+import base64
+import codecs
+import json
+import os
 
-def fetch_logs_from_api(endpoint: str, timeout: float = 5.0) -> Tuple[bool, str, List[Dict[str, Any]]]:
-    if not endpoint:
-        return False, "API Endpoint is empty!", []
-    try:
-        respons = requests.get(endpoint, timeout=timeout)
-        respons.raise_for_status()
-        data = respons.json()
+if TYPE_CHECKING:
+    import requests
+
+API_STATE_PATH = os.getenv("TUNGLOGGER_API_STATE", str(Path.home() / ".tunglogger" / "api_state.json"))
+API_POOL_SIZE = 16
+API_MAX_WORKERS = 8
+API_MAX_PAGES = 1000
+
+class ApiFormatError(ValueError):
+    pass
+
+_DECODER = json.JSONDecoder()
+_WS = " \t\r\n"
+
+def _iter_json_array(chunks: Iterable[bytes], meta: Dict[str, Any]) -> Iterator[Any]:
+    dec = codecs.getincrementaldecoder("utf-8")()
+    it = iter(chunks)
+    buf = ""
+    for chunk in it:
+        buf += dec.decode(chunk)
+        if buf.lstrip(_WS):
+            break
+    buf = buf.lstrip(_WS)
+    if not buf.startswith("["):
+        buf += "".join(dec.decode(c) for c in it) + dec.decode(b"", final=True)
+        data = json.loads(buf)
         if isinstance(data, dict) and "data" in data:
+            meta["next_cursor"] = data.get("next_cursor") or meta.get("next_cursor")
+            meta["order"] = data.get("order") or meta.get("order")
             data = data["data"]
         if not isinstance(data, list):
-            return False, "API responsonse is not listed!", []
-        return True, f"Fetched {len(data)} logs from API.", data
-    except requests.exceptions.Timeout:
-        return False, "API connection timed out!", []
-    except requests.exceptions.ConnectionError as e:
-        return False, f"API connection failed: {e}", []
-    except requests.exceptions.HTTPError as e:
-        return False, f"HTTP error: {e}", []
-    except ValueError:
-        return False, "Failed to parse JSON from API!", []
-    except Exception as e:
-        return False, f"Unexpected error: {e}", []
\ No newline at end of file
+            raise ApiFormatError("API responsonse is not listed!")
+        yield from data
+        return
+
+    pos = 1
+    done = False
+    while not done:
+        while True:
+            while pos < len(buf) and (buf[pos] in _WS or buf[pos] == ","):
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                done = True
+                break
+            try:
+                obj, end = _DECODER.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break
+            yield obj
+            pos = end
+        if done:
+            break
+        chunk = next(it, None)
+        if chunk is None:
+            raise ValueError("Truncated JSON array from API!")
+        buf = buf[pos:] + dec.decode(chunk)
+        pos = 0
+
+def _iter_records(respons: requests.Response, meta: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    meta["next_cursor"] = respons.headers.get("X-Next-Cursor")
+    meta["order"] = respons.headers.get("X-Order")
+    if "ndjson" in respons.headers.get("Content-Type", ""):
+        for line in respons.iter_lines():
+            if line.strip():
+                yield json.loads(line)
+        return
+    yield from _iter_json_array(respons.iter_content(chunk_size=65536), meta)
+
+def _parse_time(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        try:
+            dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+Mark = Tuple[datetime, int]
+
+def _encode_cursor(created: datetime, log_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created.isoformat()}|{log_id}".encode("utf-8")).decode("ascii")
+
+def _row_cursor(row: Any) -> Optional[str]:
+    if not isinstance(row, dict) or row.get("id") is None or not row.get("created_at"):
+        return None
+    created = _parse_time(row["created_at"])
+    return _encode_cursor(created, int(row["id"])) if created is not None else None
+
+def _cursor_key(cursor: Optional[str]) -> Optional[Mark]:
+    if not cursor:
+        return None
+    try:
+        created, log_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        dt = _parse_time(created)
+        return (dt, int(log_id)) if dt is not None else None
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def _as_cursor(mark: Optional[str]) -> Optional[str]:
+    if not mark or _cursor_key(mark) is not None:
+        return mark
+    created = _parse_time(mark) #marks saved before cursors were used are plain timestamps
+    return _encode_cursor(created, 0) if created is not None else None
+
+def api_error_message(e: Exception) -> str:
+    import requests
+    if isinstance(e, requests.exceptions.Timeout):
+        return "API connection timed out!"
+    if isinstance(e, requests.exceptions.ConnectionError):
+        return f"API connection failed: {e}"
+    if isinstance(e, requests.exceptions.HTTPError):
+        return f"HTTP error: {e}"
+    if isinstance(e, ApiFormatError):
+        return str(e)
+    if isinstance(e, ValueError):
+        return "Failed to parse JSON from API!"
+    return f"Unexpected error: {e}"
+
+class LogApiClient:
+    def __init__(self, timeout: float = 5.0, pool_size: int = API_POOL_SIZE, state_path: Optional[str] = None) -> None:
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._session: Optional[requests.Session] = None
+        self.state_path = Path(state_path) if state_path else None
+        self._lock = threading.Lock()
+        self._marks: Dict[str, str] = {}
+        self._pending: Dict[str, str] = {}
+        if self.state_path and self.state_path.exists():
+            try:
+                self._marks = json.loads(self.state_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._marks = {}
+
+    @property
+    def session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def high_water_mark(self, endpoint: str) -> Optional[str]:
+        with self._lock:
+            return self._marks.get(endpoint)
+
+    def reset(self, endpoint: Optional[str] = None) -> None:
+        with self._lock:
+            if endpoint is None:
+                self._marks.clear()
+            else:
+                self._marks.pop(endpoint, None)
+            self._save()
+
+    def advance(self, endpoint: str, mark: str) -> None:
+        with self._lock:
+            self._marks[endpoint] = mark
+            self._pending.pop(endpoint, None)
+            self._save()
+
+    def commit(self, endpoints: Optional[Sequence[str]] = None) -> None:
+        with self._lock:
+            for ep in list(self._pending if endpoints is None else endpoints):
+                if ep in self._pending:
+                    self._marks[ep] = self._pending.pop(ep)
+            self._save()
+
+    def _save(self) -> None:
+        if self.state_path is None:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        self.state_path.write_text(json.dumps(self._marks, indent=2), encoding="utf-8")
+
+    def iter_fetch(self, endpoint: str, incremental: bool = True) -> Iterator[Tuple[Dict[str, Any], Optional[str], bool]]:
+        #yields (row, mark, resumable): mark is the largest (created_at, id) seen so far; resumable means the server
+        #confirmed ascending order and every row so far followed it, so committing mark cannot skip a row still to come
+        mark = _as_cursor(self.high_water_mark(endpoint)) if incremental else None
+        floor = best = _cursor_key(mark)
+        resumable = incremental
+        params: Dict[str, Any] = {"order": "asc", **({"cursor": mark} if mark else {})} if incremental else {}
+        for _ in range(API_MAX_PAGES):
+            meta: Dict[str, Any] = {}
+            with self.session.get(endpoint, params=params, timeout=self.timeout, stream=True) as respons:
+                respons.raise_for_status()
+                for row in _iter_records(respons, meta):
+                    resumable = resumable and meta.get("order") == "asc"
+                    cursor = _row_cursor(row)
+                    key = _cursor_key(cursor)
+                    if floor is not None and key is not None and key <= floor:
+                        continue
+                    if key is not None and (best is None or key > best):
+                        best, mark = key, cursor
+                    elif key is not None:
+                        resumable = False
+                    yield row, mark, resumable
+            if not meta.get("next_cursor"):
+                break
+            params = {**params, "cursor": meta["next_cursor"]}
+
+    def fetch(self, endpoint: str, incremental: bool = True, commit: bool = True) -> Tuple[bool, str, List[Dict[str, Any]]]:
+        if not endpoint:
+            return False, "API Endpoint is empty!", []
+        try:
+            start = mark = self.high_water_mark(endpoint) if incremental else None
+            data: List[Dict[str, Any]] = []
+            for row, mark, _ in self.iter_fetch(endpoint, incremental):
+                data.append(row)
+            if incremental and mark and mark != start:
+                with self._lock:
+                    self._pending[endpoint] = mark
+                if commit:
+                    self.commit([endpoint])
+            return True, f"Fetched {len(data)} logs from API.", data
+        except Exception as e:
+            return False, api_error_message(e), []
+
+    def fetch_many(
+        self,
+        endpoints: Sequence[str],
+        incremental: bool = True,
+        commit: bool = True,
+        max_workers: int = API_MAX_WORKERS,
+    ) -> Dict[str, Tuple[bool, str, List[Dict[str, Any]]]]:
+        unique = list(dict.fromkeys(ep for ep in endpoints if ep))
+        if not unique:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique)))) as pool:
+            results = pool.map(lambda ep: self.fetch(ep, incremental, commit), unique)
+            return dict(zip(unique, results))
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+
+_DEFAULT_CLIENT: Optional[LogApiClient] = None
+
+def fetch_logs_from_api(endpoint: str, timeout: float = 5.0) -> Tuple[bool, str, List[Dict[str, Any]]]:
+    global _DEFAULT_CLIENT
+    if _DEFAULT_CLIENT is None:
+        _DEFAULT_CLIENT = LogApiClient()
+    _DEFAULT_CLIENT.timeout = timeout
+    return _DEFAULT_CLIENT.fetch(endpoint, incremental=False)
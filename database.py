@@ -1,13 +1,27 @@
 from __future__ import annotations
-from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
 from contextlib import contextmanager
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import count, islice
 import psycopg2
-from psycopg2 import OperationalError, DatabaseError, sql
-from psycopg2.pool import SimpleConnectionPool
+from psycopg2 import OperationalError, InterfaceError, DatabaseError, sql
+from psycopg2.extensions import connection as _PGConnection
+from psycopg2.errors import InvalidRegularExpression
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 from psycopg2.extras import RealDictCursor, execute_values
+from datetime import datetime, timedelta, timezone
+import threading
+import hashlib
+import re
+import select
 import time
+import uuid
 import logging
 from dotenv import load_dotenv
+from templates import TemplateMiner, TEMPLATES_ENABLED, TEMPLATE_LOOKUP_SQL
+from metrics import timed, inc, observe, register_collector, SIZE_BUCKETS
 import os
 
 load_dotenv()
@@ -29,28 +43,143 @@ PGSSLMODE = os.getenv("PGSSLMODE", ":) Your DC Mode Here :)")
 
 PG_MINCONN = int(os.getenv("PG_MINCONN", "1"))
 PG_MAXCONN = int(os.getenv("PG_MAXCONN", "5"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "30"))
+PG_CONNECT_TIMEOUT = int(os.getenv("PG_CONNECT_TIMEOUT", "10"))
 
-_POOL: Optional[SimpleConnectionPool] = None
+PG_COPY_THRESHOLD = int(os.getenv("PG_COPY_THRESHOLD", "5000"))
+PG_COPY_CHUNK = int(os.getenv("PG_COPY_CHUNK", "50000"))
+PG_ITERSIZE = int(os.getenv("PG_ITERSIZE", "2000"))
 
-def _ensure_pool() -> SimpleConnectionPool:
+PG_PREPARE = os.getenv("PG_PREPARE", "1") == "1" #set 0 behind pgbouncer in transaction mode
+PG_PREPARE_MAX = int(os.getenv("PG_PREPARE_MAX", "200")) #per connection, DEALLOCATE ALL once reached
+PG_FETCH_CACHE_SIZE = int(os.getenv("PG_FETCH_CACHE_SIZE", "0")) #0 disables the fetch_logs cache
+PG_FETCH_CACHE_TTL = float(os.getenv("PG_FETCH_CACHE_TTL", "5"))
+
+PG_PARTITION_INTERVAL = os.getenv("PG_PARTITION_INTERVAL", "none").lower() #none, day or month
+PG_PARTITION_PREMAKE = int(os.getenv("PG_PARTITION_PREMAKE", "3"))
+PG_RETENTION_DAYS = int(os.getenv("PG_RETENTION_DAYS", "0")) #0 keeps logs forever
+PG_MAINTENANCE_INTERVAL = float(os.getenv("PG_MAINTENANCE_INTERVAL", "3600"))
+
+PG_ENABLE_TRGM = os.getenv("PG_ENABLE_TRGM", "1") == "1"
+SEARCH_MODES = ("text", "substring", "regex")
+
+PG_NOTIFY_CHANNEL = os.getenv("PG_NOTIFY_CHANNEL", "tunglogger_logs")
+
+PG_ROLLUP_MINUTE_DAYS = int(os.getenv("PG_ROLLUP_MINUTE_DAYS", "14")) #0 keeps minute rollups forever
+PG_ROLLUP_MERGE_INTERVAL = float(os.getenv("PG_ROLLUP_MERGE_INTERVAL", "10"))
+ROLLUP_BUCKETS = ("minute", "hour", "day")
+ROLLUP_GROUPS = ("log_type", "hostname")
+
+class PoolTimeout(PoolError):
+    pass
+
+DB_UNAVAILABLE_ERRORS = (OperationalError, InterfaceError, PoolError)
+
+class PreparingConnection(_PGConnection):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.prepared: set = set()
+
+class BlockingConnectionPool(ThreadedConnectionPool):
+    def __init__(self, minconn: int, maxconn: int, *args, timeout: float = PG_POOL_TIMEOUT, **kwargs) -> None:
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._waiters = 0
+        self._acquired = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def getconn(self, key=None, timeout: Optional[float] = None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        with self._cond:
+            while self._in_use >= self.maxconn:
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    inc("db_pool_timeouts_total")
+                    raise PoolTimeout(f"No database connection available within {timeout:.1f}s!")
+                self._waiters += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiters -= 1
+            self._in_use += 1
+            waited = time.monotonic() - start
+            self._acquired += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        observe("db_pool_wait_seconds", waited)
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._release()
+            raise
+
+    def putconn(self, conn=None, key=None, close: bool = False) -> None:
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "size": self.maxconn,
+                "in_use": self._in_use,
+                "idle": len(self._pool),
+                "waiters": self._waiters,
+                "acquired": self._acquired,
+                "timeouts": self._timeouts,
+                "wait_total_s": round(self._wait_total, 6),
+                "wait_avg_s": round(self._wait_total / self._acquired, 6) if self._acquired else 0.0,
+                "wait_max_s": round(self._wait_max, 6),
+            }
+
+def _dsn() -> str:
+    return (
+        f"host={PGHOST} port={PGPORT} dbname={PGDATABASE} "
+        f"user={PGUSER} password={PGPASSWORD} sslmode={PGSSLMODE} "
+        f"connect_timeout={PG_CONNECT_TIMEOUT}"
+    )
+
+_POOL: Optional[BlockingConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+
+def _ensure_pool() -> BlockingConnectionPool:
     global _POOL
     if _POOL is not None:
         return _POOL
 
-    dsn = (
-        f"host={PGHOST} port={PGPORT} dbname={PGDATABASE} "
-        f"user={PGUSER} password={PGPASSWORD} sslmode={PGSSLMODE}"
-    )
-    try:
-        _POOL = SimpleConnectionPool(
-            PG_MINCONN, PG_MAXCONN, dsn=dsn, cursor_factory=RealDictCursor
-        )
-        logger.info("Database connection successfully initialized!")
-    except Exception as e:
-        logger.error("Failed to initialize connection pool: %s!", e)
-        raise
+    with _POOL_LOCK:
+        if _POOL is not None:
+            return _POOL
+        try:
+            _POOL = BlockingConnectionPool(
+                PG_MINCONN, PG_MAXCONN, dsn=_dsn(), cursor_factory=RealDictCursor, connection_factory=PreparingConnection
+            )
+            logger.info("Database connection successfully initialized!")
+        except Exception as e:
+            logger.error("Failed to initialize connection pool: %s!", e)
+            raise
     return _POOL
 
+def pool_stats() -> Dict[str, Any]:
+    if _POOL is None:
+        return {"size": PG_MAXCONN, "in_use": 0, "idle": 0, "waiters": 0, "acquired": 0, "timeouts": 0,
+                "wait_total_s": 0.0, "wait_avg_s": 0.0, "wait_max_s": 0.0}
+    return _POOL.stats()
+
+register_collector("db_pool", pool_stats)
+
 @contextmanager
 def get_conn():
     pool = _ensure_pool()
@@ -58,9 +187,13 @@ def get_conn():
     try:
         conn = pool.getconn()
         yield conn
+    except BaseException:
+        if conn is not None and not conn.closed:
+            conn.rollback()
+        raise
     finally:
         if conn is not None:
-            pool.putconn(conn)
+            pool.putconn(conn, close=bool(conn.closed))
 
 def _with_retry(func, attempts: int = 3, base_delay: float = 0.5):
     last_exc = None
@@ -69,95 +202,1123 @@ def _with_retry(func, attempts: int = 3, base_delay: float = 0.5):
             return func()
         except OperationalError as e:
             last_exc = e
+            if i + 1 >= attempts:
+                inc("db_errors_total", kind="operational")
+                logger.warning("OperationalError, giving up (%d/%d): %s", i + 1, attempts, e)
+                break
+            inc("db_retries_total")
             delay = base_delay * (2 ** i)
             logger.warning("OperationalError, retrying in %.1fs (%d/%d): %s",delay, i + 1, attempts, e)
             time.sleep(delay)
         except DatabaseError as e:
+            inc("db_errors_total", kind="database")
             logger.error("DatabaseError (no retry): %s", e)
             raise
     assert last_exc is not None
     raise last_exc
 
-def init_db() -> None:
+_PLACEHOLDER = re.compile(r"%s")
+
+@lru_cache(maxsize=1024)
+def _statement(query: str) -> Tuple[str, str]:
+    n = count(1)
+    return "tl_" + hashlib.sha1(query.encode("utf-8")).hexdigest()[:16], _PLACEHOLDER.sub(lambda _: f"${next(n)}", query)
+
+def _execute(cur, query: str, params: Sequence[Any] = ()) -> None:
+    prepared = getattr(cur.connection, "prepared", None)
+    if not PG_PREPARE or prepared is None:
+        cur.execute(query, params)
+        return
+    name, numbered = _statement(query)
+    if name not in prepared:
+        if len(prepared) >= PG_PREPARE_MAX:
+            cur.execute("DEALLOCATE ALL;")
+            prepared.clear()
+        cur.execute(f"PREPARE {name} AS {numbered}")
+        prepared.add(name)
+        inc("db_prepared_total")
+    cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})" if params else f"EXECUTE {name}", params)
+
+_SEARCH_SQL = "tl_message(log_message, template_id, params)" #must match the index expressions
+
+_LOGS_COLUMNS = """
+    log_type VARCHAR(32) NOT NULL,
+    log_message TEXT NOT NULL,
+    hostname VARCHAR(255) NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+"""
+
+def partitioning_enabled() -> bool:
+    return PG_PARTITION_INTERVAL in ("day", "month")
+
+SCHEMA_VERSION = 6 #bump whenever _migrate changes
+_SCHEMA_READY = False
+
+#every setting only adds objects, so processes configured differently share one schema as long as each finds its tokens recorded
+def _schema_tokens() -> Set[str]:
+    tokens = {f"partition:{PG_PARTITION_INTERVAL}", f"notify:{PG_NOTIFY_CHANNEL}"}
+    if PG_ENABLE_TRGM:
+        tokens.add("trgm")
+    if TEMPLATES_ENABLED:
+        tokens.add("templates")
+    return tokens
+
+def _recorded_schema(cur) -> Optional[Tuple[int, Set[str]]]:
+    cur.execute("SELECT to_regclass('schema_version') IS NOT NULL AS tracked, to_regclass('logs') IS NOT NULL AS present;")
+    row = cur.fetchone()
+    if not (row["tracked"] and row["present"]):
+        return None
+    cur.execute("SELECT version, fingerprint FROM schema_version WHERE id;")
+    row = cur.fetchone()
+    return (row["version"], set(row["fingerprint"].split())) if row else None
+
+def _schema_current(cur) -> bool:
+    recorded = _recorded_schema(cur)
+    if recorded is None:
+        return False
+    version, tokens = recorded
+    if version > SCHEMA_VERSION:
+        logger.warning("Database schema version %d is newer than this build (%d); skipping migration.", version, SCHEMA_VERSION)
+        return True
+    return version == SCHEMA_VERSION and _schema_tokens() <= tokens
+
+@timed("db_call_seconds", fn="init_db")
+def init_db(force: bool = False) -> None:
+    global _SCHEMA_READY
+    if _SCHEMA_READY and not force:
+        return
+
     def _do():
         with get_conn() as conn, conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS logs (
-                    id SERIAL PRIMARY KEY,
-                    log_type VARCHAR(32) NOT NULL,
-                    log_message TEXT NOT NULL,
-                    hostname VARCHAR(255) NOT NULL,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                );
-            """)
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_type ON logs(log_type);")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_created_at ON logs(created_at);")
+            if not force and _schema_current(cur):
+                if partitioning_enabled() and _is_partitioned(cur):
+                    _ensure_partitions(cur, PG_PARTITION_PREMAKE)
+                conn.commit()
+                return
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('tunglogger_schema'));")
+            if not force and _schema_current(cur):
+                conn.commit()
+                return
+            _migrate(cur)
             conn.commit()
+            logger.info("Database schema migrated to version %d.", SCHEMA_VERSION)
     _with_retry(_do)
+    _SCHEMA_READY = True
+
+def _migrate(cur) -> None:
+    recorded = _recorded_schema(cur)
+    tokens = _schema_tokens() | (recorded[1] if recorded is not None and recorded[0] == SCHEMA_VERSION else set())
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('logs');")
+    existing = cur.fetchone()
+    if partitioning_enabled() and existing is None:
+        cur.execute(f"""
+            CREATE TABLE logs (
+                id SERIAL,
+                {_LOGS_COLUMNS},
+                PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at);
+        """)
+        cur.execute("CREATE TABLE IF NOT EXISTS logs_default PARTITION OF logs DEFAULT;")
+    else:
+        if partitioning_enabled() and existing["relkind"] != "p":
+            logger.warning("Table 'logs' already exists unpartitioned; PG_PARTITION_INTERVAL is ignored until it is migrated.")
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS logs (
+                id SERIAL PRIMARY KEY,
+                {_LOGS_COLUMNS}
+            );
+        """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_created_at_id ON logs(created_at DESC, id DESC);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_type_created_at ON logs(log_type, created_at DESC, id DESC);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_host_created_at ON logs(hostname, created_at DESC, id DESC);")
+    cur.execute("DROP INDEX IF EXISTS idx_logs_type, idx_logs_created_at;") #covered by the composite indexes above
+    cur.execute("ALTER TABLE logs ADD COLUMN IF NOT EXISTS ingest_key UUID;")
+    _ensure_templates(cur)
+    cur.execute("ALTER TABLE logs DROP COLUMN IF EXISTS search_vec;") #replaced by the rendered-message index below
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_logs_message_fts ON logs USING GIN (to_tsvector('simple', {_SEARCH_SQL}));")
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_logs_ingest_key ON logs(ingest_key, created_at)
+        WHERE ingest_key IS NOT NULL;
+    """)
+    if PG_ENABLE_TRGM:
+        _ensure_trgm_index(cur)
+    _ensure_notify_trigger(cur)
+    _ensure_rollups(cur)
+    if _is_partitioned(cur):
+        _ensure_partitions(cur, PG_PARTITION_PREMAKE)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            version INTEGER NOT NULL,
+            fingerprint TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    """)
+    cur.execute(
+        """
+        INSERT INTO schema_version (id, version, fingerprint) VALUES (TRUE, %s, %s)
+        ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version, fingerprint = EXCLUDED.fingerprint, applied_at = NOW();
+        """,
+        (SCHEMA_VERSION, " ".join(sorted(tokens))),
+    )
+
+def _ensure_templates(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS log_templates (
+            id SERIAL PRIMARY KEY,
+            template TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    """)
+    cur.execute("ALTER TABLE logs ADD COLUMN IF NOT EXISTS template_id INTEGER, ADD COLUMN IF NOT EXISTS params TEXT[];")
+    if TEMPLATES_ENABLED:
+        cur.execute("ALTER TABLE logs ALTER COLUMN log_message DROP NOT NULL;")
+    #both functions back index expressions, so they pin search_path (restores and REINDEX run with a restricted one)
+    cur.execute("SELECT current_schema() AS schema;")
+    path = sql.SQL("SET search_path = {}, pg_catalog").format(sql.Identifier(cur.fetchone()["schema"]))
+    cur.execute(sql.SQL("""
+        CREATE OR REPLACE FUNCTION tl_render(tpl TEXT, params TEXT[]) RETURNS TEXT
+        LANGUAGE plpgsql IMMUTABLE {path} AS $$
+        DECLARE
+            parts TEXT[] := string_to_array(tpl, ' ');
+            n INT := COALESCE(array_length(params, 1), 0);
+            j INT := 0;
+        BEGIN
+            IF tpl IS NULL THEN
+                RETURN NULL;
+            END IF;
+            FOR i IN 1..COALESCE(array_length(parts, 1), 0) LOOP
+                IF parts[i] = '<*>' THEN
+                    j := j + 1;
+                    IF j > n OR params[j] IS NULL THEN
+                        RAISE EXCEPTION 'template % needs more than % non-null params', tpl, j - 1;
+                    END IF;
+                    parts[i] := params[j];
+                END IF;
+            END LOOP;
+            IF j <> n THEN
+                RAISE EXCEPTION 'template % has % placeholders but % params', tpl, j, n;
+            END IF;
+            RETURN array_to_string(parts, ' ');
+        END;
+        $$;
+    """).format(path=path))
+    #reading log_templates is only safe in an IMMUTABLE function because the trigger below makes the table append-only
+    cur.execute(sql.SQL("""
+        CREATE OR REPLACE FUNCTION tl_message(msg TEXT, tpl_id INTEGER, params TEXT[]) RETURNS TEXT
+        LANGUAGE plpgsql IMMUTABLE {path} AS $$
+        BEGIN
+            IF msg IS NOT NULL OR tpl_id IS NULL THEN
+                RETURN msg;
+            END IF;
+            RETURN tl_render((SELECT t.template FROM log_templates t WHERE t.id = tpl_id), params);
+        END;
+        $$;
+    """).format(path=path))
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION tl_templates_append_only() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            RAISE EXCEPTION 'log_templates is append-only, indexed log messages are rendered from it';
+        END;
+        $$;
+    """)
+    cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = 'trg_log_templates_append_only' AND tgrelid = to_regclass('log_templates');")
+    if cur.fetchone() is None:
+        cur.execute("""
+            CREATE TRIGGER trg_log_templates_append_only
+            BEFORE UPDATE OR DELETE OR TRUNCATE ON log_templates
+            FOR EACH STATEMENT EXECUTE FUNCTION tl_templates_append_only();
+        """)
+    cur.execute("SELECT 1 FROM pg_constraint WHERE conname = 'logs_template_id_fkey' AND conrelid = to_regclass('logs');")
+    if cur.fetchone() is None:
+        cur.execute("""
+            UPDATE logs l SET log_message = array_to_string(l.params, ' '), template_id = NULL
+            WHERE l.template_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM log_templates t WHERE t.id = l.template_id);
+        """)
+        if cur.rowcount:
+            logger.warning("Detached %d logs from missing templates; their parameters are kept as the message.", cur.rowcount)
+        cur.execute("ALTER TABLE logs ADD CONSTRAINT logs_template_id_fkey FOREIGN KEY (template_id) REFERENCES log_templates(id);")
+
+def _ensure_notify_trigger(cur) -> None:
+    cur.execute("CREATE TABLE IF NOT EXISTS log_notify_channels (channel TEXT PRIMARY KEY);")
+    cur.execute("INSERT INTO log_notify_channels (channel) VALUES (%s) ON CONFLICT DO NOTHING;", (PG_NOTIFY_CHANNEL,))
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION tl_notify_logs() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            payload TEXT := COALESCE((SELECT max(id) FROM new_rows)::text, '');
+        BEGIN
+            PERFORM pg_notify(c.channel, payload) FROM log_notify_channels c;
+            RETURN NULL;
+        END;
+        $$;
+    """)
+    cur.execute("SELECT tgnargs FROM pg_trigger WHERE tgname = 'trg_logs_notify' AND tgrelid = to_regclass('logs');")
+    row = cur.fetchone()
+    if row is not None and row["tgnargs"]:
+        cur.execute("DROP TRIGGER trg_logs_notify ON logs;") #older triggers carried a single channel argument
+        row = None
+    if row is None:
+        cur.execute("""
+            CREATE TRIGGER trg_logs_notify
+            AFTER INSERT ON logs
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION tl_notify_logs();
+        """)
+
+def _ensure_rollups(cur) -> None:
+    cur.execute("SELECT to_regclass('log_rollup_minute') IS NULL AS fresh;")
+    fresh = cur.fetchone()["fresh"]
+    for unit in ("minute", "hour"):
+        cur.execute(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {} (
+                bucket TIMESTAMPTZ NOT NULL,
+                log_type VARCHAR(32) NOT NULL,
+                hostname VARCHAR(255) NOT NULL,
+                count BIGINT NOT NULL,
+                PRIMARY KEY (bucket, log_type, hostname)
+            );
+        """).format(sql.Identifier(f"log_rollup_{unit}")))
+    #writers only append here, so concurrent inserts never wait on each other's rollup row locks
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS log_rollup_delta (
+            bucket TIMESTAMPTZ NOT NULL,
+            log_type VARCHAR(32) NOT NULL,
+            hostname VARCHAR(255) NOT NULL,
+            count BIGINT NOT NULL
+        );
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION tl_rollup_logs() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO log_rollup_delta (bucket, log_type, hostname, count)
+            SELECT date_bin('1 minute', created_at, TIMESTAMPTZ 'epoch'), log_type, hostname, count(*)
+            FROM new_rows GROUP BY 1, 2, 3;
+            RETURN NULL;
+        END;
+        $$;
+    """)
+    cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = 'trg_logs_rollup' AND tgrelid = to_regclass('logs');")
+    if cur.fetchone() is None:
+        cur.execute("""
+            CREATE TRIGGER trg_logs_rollup
+            AFTER INSERT ON logs
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION tl_rollup_logs();
+        """)
+    if fresh:
+        for unit in ("minute", "hour"):
+            cur.execute(sql.SQL("""
+                INSERT INTO {} (bucket, log_type, hostname, count)
+                SELECT date_bin({}, created_at, TIMESTAMPTZ 'epoch'), log_type, hostname, count(*)
+                FROM logs GROUP BY 1, 2, 3;
+            """).format(sql.Identifier(f"log_rollup_{unit}"), sql.Literal(f"1 {unit}")))
+        logger.info("Rollups backfilled from existing logs.")
+
+def _ensure_trgm_index(cur) -> None:
+    cur.execute("SAVEPOINT tl_trgm;")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+        cur.execute("DROP INDEX IF EXISTS idx_logs_message_trgm;")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_logs_rendered_trgm ON logs USING GIN ({_SEARCH_SQL} gin_trgm_ops);")
+        cur.execute("RELEASE SAVEPOINT tl_trgm;")
+    except DatabaseError as e:
+        cur.execute("ROLLBACK TO SAVEPOINT tl_trgm;")
+        logger.warning("pg_trgm unavailable, substring/regex search will scan: %s", e)
 
-def insert_log_row(log_type: str, log_message: str, hostname: str, created_at) -> Dict[str, Any]:
+def _is_partitioned(cur) -> bool:
+    cur.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('logs');")
+    return cur.fetchone() is not None
+
+def _period_start(ts: datetime) -> datetime:
+    ts = ts.astimezone(timezone.utc)
+    if PG_PARTITION_INTERVAL == "month":
+        return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _next_period(start: datetime) -> datetime:
+    if PG_PARTITION_INTERVAL == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+def _partition_name(start: datetime) -> str:
+    return f"logs_p{start:%Y%m}" if PG_PARTITION_INTERVAL == "month" else f"logs_p{start:%Y%m%d}"
+
+def _list_partitions(cur) -> List[str]:
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('logs')
+        ORDER BY c.relname;
+    """)
+    return [r["relname"] for r in cur.fetchall()]
+
+def _partitions_ending_by(cur, cutoff: datetime) -> List[str]:
+    cur.execute(r"""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('logs')
+          AND substring(pg_get_expr(c.relpartbound, c.oid) FROM 'TO \(''([^'']+)''\)')::timestamptz <= %s
+        ORDER BY c.relname;
+    """, (cutoff,))
+    return [r["relname"] for r in cur.fetchall()]
+
+def _create_partition(cur, name: str, start: datetime, end: datetime) -> None:
+    ident = sql.Identifier(name)
+    cur.execute("SELECT EXISTS (SELECT 1 FROM logs_default WHERE created_at >= %s AND created_at < %s) AS stranded;", (start, end))
+    if not cur.fetchone()["stranded"]:
+        cur.execute(sql.SQL("CREATE TABLE {} PARTITION OF logs FOR VALUES FROM (%s) TO (%s);").format(ident), (start, end))
+        return
+    #rows that landed in the default partition would block the new range, so move them into it before attaching
+    cur.execute(sql.SQL("CREATE TABLE {} (LIKE logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS);").format(ident))
+    cur.execute(
+        sql.SQL("""
+            WITH moved AS (
+                DELETE FROM logs_default WHERE created_at >= %s AND created_at < %s RETURNING *
+            )
+            INSERT INTO {} SELECT * FROM moved;
+        """).format(ident),
+        (start, end),
+    )
+    logger.warning("Moved %d rows from logs_default into new partition %s.", cur.rowcount, name)
+    cur.execute(sql.SQL("ALTER TABLE logs ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s);").format(ident), (start, end))
+
+def _ensure_partitions(cur, ahead: int) -> List[str]:
+    existing = set(_list_partitions(cur))
+    created = []
+    start = _period_start(datetime.now(timezone.utc))
+    for _ in range(max(0, ahead) + 1):
+        end = _next_period(start)
+        name = _partition_name(start)
+        if name not in existing:
+            cur.execute("SAVEPOINT tl_partition;")
+            try:
+                _create_partition(cur, name, start, end)
+                cur.execute("RELEASE SAVEPOINT tl_partition;")
+                created.append(name)
+            except DatabaseError as e:
+                cur.execute("ROLLBACK TO SAVEPOINT tl_partition;")
+                logger.error("Could not create partition %s: %s", name, e)
+        start = end
+    if created:
+        logger.info("Created partitions: %s", ", ".join(created))
+    return created
+
+@timed("db_call_seconds", fn="ensure_partitions")
+def ensure_partitions(ahead: int = PG_PARTITION_PREMAKE) -> List[str]:
+    def _do():
+        with get_conn() as conn, conn.cursor() as cur:
+            created = _ensure_partitions(cur, ahead) if _is_partitioned(cur) else []
+            conn.commit()
+            return created
+    return _with_retry(_do)
+
+@timed("db_call_seconds", fn="drop_partitions_before")
+def drop_partitions_before(cutoff: datetime) -> List[str]:
+    def _do():
+        with get_conn() as conn, conn.cursor() as cur:
+            if not _is_partitioned(cur):
+                cur.execute("DELETE FROM logs WHERE created_at < %s;", (cutoff,))
+                logger.info("Retention deleted %d rows older than %s.", cur.rowcount, cutoff)
+                conn.commit()
+                FETCH_CACHE.invalidate()
+                return []
+            dropped = []
+            for name in _partitions_ending_by(cur, cutoff):
+                cur.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(name)))
+                dropped.append(name)
+            cur.execute("DELETE FROM logs_default WHERE created_at < %s;", (cutoff,))
+            conn.commit()
+            FETCH_CACHE.invalidate()
+            if dropped:
+                logger.info("Retention dropped partitions: %s", ", ".join(dropped))
+            return dropped
+    return _with_retry(_do)
+
+@timed("db_call_seconds", fn="log_range_before")
+def log_range_before(cutoff: datetime) -> Dict[str, Any]:
+    def _do():
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute("SELECT min(id) AS min_id, max(id) AS max_id, min(created_at) AS min_created FROM logs WHERE created_at < %s;", (cutoff,))
+            row = dict(cur.fetchone())
+            conn.commit()
+            return row
+    return _with_retry(_do)
+
+@timed("db_call_seconds", fn="delete_logs_before")
+def delete_logs_before(cutoff: datetime, max_id: Optional[int] = None) -> int:
     def _do():
         with get_conn() as conn, conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO logs (log_type, log_message, hostname, created_at)
-                VALUES (%s, %s, %s, %s)
-                RETURNING id, log_type, log_message, hostname, created_at;
+            if max_id is None:
+                cur.execute("DELETE FROM logs WHERE created_at < %s;", (cutoff,))
+            else:
+                cur.execute("DELETE FROM logs WHERE created_at < %s AND id <= %s;", (cutoff, max_id))
+            deleted = cur.rowcount
+            conn.commit()
+            FETCH_CACHE.invalidate()
+            return deleted
+    return _with_retry(_do)
+
+def apply_retention(days: int = PG_RETENTION_DAYS) -> List[str]:
+    if days <= 0:
+        return []
+    return drop_partitions_before(datetime.now(timezone.utc) - timedelta(days=days))
+
+_MERGE_ROLLUPS_SQL = """
+    WITH moved AS (
+        DELETE FROM log_rollup_delta RETURNING bucket, log_type, hostname, count
+    ), minutes AS (
+        SELECT bucket, log_type, hostname, sum(count) AS n FROM moved GROUP BY 1, 2, 3
+    ), ins AS (
+        INSERT INTO log_rollup_minute (bucket, log_type, hostname, count)
+        SELECT bucket, log_type, hostname, n FROM minutes ORDER BY 1, 2, 3
+        ON CONFLICT (bucket, log_type, hostname) DO UPDATE SET count = log_rollup_minute.count + EXCLUDED.count
+    )
+    INSERT INTO log_rollup_hour (bucket, log_type, hostname, count)
+    SELECT date_bin('1 hour', bucket, TIMESTAMPTZ 'epoch'), log_type, hostname, sum(n)
+    FROM minutes GROUP BY 1, 2, 3 ORDER BY 1, 2, 3
+    ON CONFLICT (bucket, log_type, hostname) DO UPDATE SET count = log_rollup_hour.count + EXCLUDED.count;
+"""
+
+@timed("db_call_seconds", fn="merge_rollups")
+def merge_rollups() -> bool:
+    def _do():
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('tunglogger_rollup_merge')) AS locked;")
+            if not cur.fetchone()["locked"]:
+                conn.commit()
+                return False
+            cur.execute(_MERGE_ROLLUPS_SQL)
+            conn.commit()
+            return True
+    return _with_retry(_do)
+
+@timed("db_call_seconds", fn="prune_rollups")
+def prune_rollups(days: int = PG_ROLLUP_MINUTE_DAYS) -> int:
+    if days <= 0:
+        return 0
+
+    def _do():
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM log_rollup_minute WHERE bucket < %s;", (datetime.now(timezone.utc) - timedelta(days=days),))
+            deleted = cur.rowcount
+            conn.commit()
+            return deleted
+    return _with_retry(_do)
+
+@timed("db_call_seconds", fn="run_maintenance")
+def run_maintenance() -> None:
+    merge_rollups()
+    ensure_partitions()
+    apply_retention()
+    prune_rollups()
+
+MAINTENANCE_TICK = min(PG_ROLLUP_MERGE_INTERVAL, PG_MAINTENANCE_INTERVAL)
+
+def maintenance_tick(due: float) -> float:
+    #called every MAINTENANCE_TICK seconds; merges rollup deltas, and runs full maintenance once the monotonic `due` has passed
+    if time.monotonic() < due:
+        merge_rollups()
+        return due
+    run_maintenance()
+    return time.monotonic() + PG_MAINTENANCE_INTERVAL
+
+TEMPLATE_MINER = TemplateMiner()
+_PLAIN_COLUMNS = "log_type, log_message, hostname, created_at"
+_TEMPLATED_COLUMNS = "log_type, log_message, hostname, created_at, template_id, params"
+
+def _templated(cur, rows: Sequence[Tuple[str, str, str, Any]]) -> Tuple[str, Sequence[Sequence[Any]]]:
+    if not TEMPLATES_ENABLED:
+        return _PLAIN_COLUMNS, rows
+    extracted = TEMPLATE_MINER.extract_rows(rows)
+    missing = TEMPLATE_MINER.missing(extracted)
+    if missing:
+        cur.execute(TEMPLATE_LOOKUP_SQL, (missing, missing))
+        found = cur.fetchall()
+        cur.connection.commit() #ids are cached only once the templates are durable, whatever happens to the rows
+        TEMPLATE_MINER.remember((r["id"], r["template"]) for r in found)
+    return _TEMPLATED_COLUMNS, TEMPLATE_MINER.encode(rows, extracted)
+
+def template_stats() -> Dict[str, Any]:
+    return {"enabled": TEMPLATES_ENABLED, **TEMPLATE_MINER.stats()}
+
+#a keyed write whose commit ack was lost returns the row it already stored instead of a duplicate
+_KEYED_CONFLICT = "ON CONFLICT (ingest_key, created_at) WHERE ingest_key IS NOT NULL DO UPDATE SET ingest_key = EXCLUDED.ingest_key"
+
+@timed("db_call_seconds", fn="insert_log_row")
+def insert_log_row(
+    log_type: str,
+    log_message: str,
+    hostname: str,
+    created_at,
+    attempts: int = 3,
+    ingest_key: Optional[str] = None,
+) -> Dict[str, Any]:
+    def _do():
+        with get_conn() as conn, conn.cursor() as cur:
+            columns, rows = _templated(cur, [(log_type, log_message, hostname, created_at)])
+            row = rows[0] if ingest_key is None else (ingest_key, *rows[0])
+            _execute(
+                cur,
+                f"""
+                INSERT INTO logs ({columns if ingest_key is None else "ingest_key, " + columns})
+                VALUES ({", ".join(["%s"] * len(row))})
+                {"" if ingest_key is None else _KEYED_CONFLICT}
+                RETURNING id, log_type, hostname, created_at
                 """,
-                (log_type, log_message, hostname, created_at)
+                row
             )
             row = cur.fetchone()
             conn.commit()
-            return dict(row) if row else {}
-    return _with_retry(_do)
+            FETCH_CACHE.invalidate()
+            inc("db_rows_written_total", 1, fn="insert_log_row")
+            return {**row, "log_message": log_message} if row else {}
+    return _with_retry(_do, attempts)
 
-def insert_logs_bulk(rows: Sequence[Tuple[str, str, str, Any]]) -> int:
+@timed("db_call_seconds", fn="insert_logs_bulk")
+def insert_logs_bulk(rows: Iterable[Tuple[str, str, str, Any]], on_commit: Optional[Callable[[int], None]] = None) -> int:
+    if not isinstance(rows, (list, tuple)) or len(rows) >= PG_COPY_THRESHOLD:
+        return copy_logs(rows, on_commit=on_commit)
     if not rows:
         return 0
 
     def _do():
         with get_conn() as conn, conn.cursor() as cur:
+            columns, values = _templated(cur, rows)
             execute_values(
                 cur,
-                """
-                INSERT INTO logs (log_type, log_message, hostname, created_at)
+                f"""
+                INSERT INTO logs ({columns})
                 VALUES %s
                 """,
-                rows
+                values,
+                page_size=len(rows),
             )
             affli = cur.rowcount or len(rows)
             conn.commit()
+            FETCH_CACHE.invalidate()
+            inc("db_rows_written_total", affli, fn="insert_logs_bulk")
+            observe("db_batch_rows", len(rows), SIZE_BUCKETS, fn="insert_logs_bulk")
             return affli
-    return _with_retry(_do)
+    affli = _with_retry(_do)
+    if on_commit is not None:
+        on_commit(len(rows))
+    return affli
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+def _copy_array(values: Sequence[Any]) -> str:
+    return "{" + ",".join('"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for v in values) + "}"
+
+def _copy_field(value: Any) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, (list, tuple)):
+        value = _copy_array(value)
+    elif hasattr(value, "isoformat"):
+        value = value.isoformat()
+    return str(value).translate(_COPY_ESCAPES)
+
+class _CopyStream:
+    def __init__(self, rows: Iterable[Sequence[Any]]) -> None:
+        self._rows = iter(rows)
+        self._buf = b""
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buf) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._buf += ("\t".join(_copy_field(v) for v in row) + "\n").encode("utf-8")
+        if size < 0:
+            size = len(self._buf)
+        out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+    readline = read
+
+@timed("db_call_seconds", count="db_rows_written_total", fn="copy_logs")
+def copy_logs(
+    rows: Iterable[Tuple[str, str, str, Any]],
+    chunk_size: int = PG_COPY_CHUNK,
+    on_commit: Optional[Callable[[int], None]] = None,
+) -> int:
+    it = iter(rows)
+    total = 0
+    while True:
+        chunk = list(islice(it, max(1, chunk_size)))
+        if not chunk:
+            break
+
+        def _do(chunk=chunk):
+            with get_conn() as conn, conn.cursor() as cur:
+                columns, values = _templated(cur, chunk)
+                cur.copy_expert(f"COPY logs ({columns}) FROM STDIN", _CopyStream(values))
+                conn.commit()
+                FETCH_CACHE.invalidate()
+                observe("db_batch_rows", len(chunk), SIZE_BUCKETS, fn="copy_logs")
+                return len(chunk)
+        total += _with_retry(_do)
+        logger.debug("COPY committed %d rows (%d total).", len(chunk), total)
+        if on_commit is not None:
+            on_commit(total)
+    return total
+
+@timed("db_call_seconds", fn="insert_logs_bulk_returning")
+def insert_logs_bulk_returning(
+    rows: Sequence[Tuple[str, str, str, Any]],
+    attempts: int = 3,
+    ingest_keys: Optional[Sequence[str]] = None,
+) -> List[Dict[str, Any]]:
+    if not rows:
+        return []
 
-def fetch_logs(log_types: Optional[Sequence[str]] = None, limit: int = 500) -> List[Dict[str, Any]]:
     def _do():
         with get_conn() as conn, conn.cursor() as cur:
-            if log_types:
-                cur.execute(
-                    """
-                    SELECT id, log_type, log_message, hostname, created_at
-                    FROM logs
-                    WHERE log_type = ANY(%s)
-                    ORDER BY created_at DESC
-                    LIMIT %s
-                    """,
-                    (list(log_types), limit)
-                )
+            columns, values = _templated(cur, rows)
+            if ingest_keys is not None:
+                columns, values = "ingest_key, " + columns, [(k, *v) for k, v in zip(ingest_keys, values)]
+            inserted = execute_values(
+                cur,
+                f"""
+                INSERT INTO logs ({columns})
+                VALUES %s
+                {"" if ingest_keys is None else _KEYED_CONFLICT}
+                RETURNING id, log_type, hostname, created_at
+                """,
+                values,
+                page_size=max(len(rows), 100),
+                fetch=True
+            )
+            conn.commit()
+            FETCH_CACHE.invalidate()
+            inc("db_rows_written_total", len(inserted), fn="insert_logs_bulk_returning")
+            observe("db_batch_rows", len(rows), SIZE_BUCKETS, fn="insert_logs_bulk_returning")
+            return [{**r, "log_message": row[1]} for r, row in zip(inserted, rows)]
+    return _with_retry(_do, attempts)
+
+@timed("db_call_seconds", count="db_rows_written_total", fn="insert_logs_replay")
+def insert_logs_replay(rows: Sequence[Tuple[str, str, str, str, Any]]) -> int:
+    if not rows:
+        return 0
+
+    def _do():
+        with get_conn() as conn, conn.cursor() as cur:
+            columns, values = _templated(cur, [r[1:] for r in rows])
+            execute_values(
+                cur,
+                f"""
+                INSERT INTO logs (ingest_key, {columns})
+                VALUES %s
+                ON CONFLICT (ingest_key, created_at) WHERE ingest_key IS NOT NULL DO NOTHING
+                """,
+                [(r[0], *v) for r, v in zip(rows, values)],
+                page_size=len(rows),
+            )
+            inserted = cur.rowcount
+            conn.commit()
+            FETCH_CACHE.invalidate()
+            return inserted
+    return _with_retry(_do, attempts=1)
+
+_MESSAGE_SQL = "COALESCE(l.log_message, tl_render((SELECT t.template FROM log_templates t WHERE t.id = l.template_id), l.params))"
+_SELECT_LOGS = f"SELECT l.id, l.log_type, {_MESSAGE_SQL} AS log_message, l.hostname, l.created_at FROM logs l"
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+QUERY_ORDERS = ("desc", "asc")
+
+@dataclass
+class LogQuery:
+    types: Optional[Sequence[str]] = None
+    hosts: Optional[Sequence[str]] = None
+    since: Any = None
+    until: Any = None
+    text: Optional[str] = None
+    contains: Optional[str] = None
+    regex: Optional[str] = None
+    order: str = "desc"
+    cursor: Optional[Tuple[Any, Optional[int]]] = None
+    limit: Optional[int] = None
+
+    def compile(self) -> Tuple[str, List[Any]]:
+        if self.order not in QUERY_ORDERS:
+            raise ValueError(f"Invalid order '{self.order}'. Allowed: {', '.join(QUERY_ORDERS)}")
+        clauses: List[str] = []
+        params: List[Any] = []
+        if self.types:
+            clauses.append("log_type = ANY(%s)")
+            params.append(list(self.types))
+        if self.hosts:
+            clauses.append("hostname = ANY(%s)")
+            params.append(list(self.hosts))
+        for clause, value in self._message_filters():
+            clauses.append(clause)
+            params.append(value)
+        if self.since is not None:
+            clauses.append("created_at >= %s")
+            params.append(self.since)
+        if self.until is not None:
+            clauses.append("created_at < %s")
+            params.append(self.until)
+        if self.cursor is not None and self.cursor[0] is not None:
+            cursor_at, cursor_id = self.cursor
+            op, bound = ("<", "<=") if self.order == "desc" else (">", ">=")
+            if cursor_id is not None:
+                clauses.append(f"created_at {bound} %s AND (created_at, id) {op} (%s, %s)")
+                params.extend([cursor_at, cursor_at, cursor_id])
             else:
-                cur.execute(
-                    """
-                    SELECT id, log_type, log_message, hostname, created_at
-                    FROM logs
-                    ORDER BY created_at DESC
-                    LIMIT %s
-                    """,
-                    (limit,)
-                )
+                clauses.append(f"created_at {op} %s")
+                params.append(cursor_at)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        direction = self.order.upper()
+        query = f"""
+            {_SELECT_LOGS}
+            {where}
+            ORDER BY created_at {direction}, id {direction}
+        """
+        if self.limit is not None:
+            query += " LIMIT %s"
+            params.append(self.limit)
+        return query, params
+
+    def _message_filters(self) -> List[Tuple[str, str]]:
+        filters: List[Tuple[str, str]] = []
+        if self.text:
+            filters.append((f"to_tsvector('simple', {_SEARCH_SQL}) @@ websearch_to_tsquery('simple', %s)", self.text))
+        if self.contains:
+            filters.append((f"{_SEARCH_SQL} ILIKE %s", "%" + _escape_like(self.contains) + "%"))
+        if self.regex:
+            filters.append((f"{_SEARCH_SQL} ~* %s", self.regex))
+        return filters
+
+def build_fetch_query(
+    log_types: Optional[Sequence[str]],
+    before_created_at: Any,
+    before_id: Optional[int],
+    since: Any = None,
+    until: Any = None,
+    search: Optional[str] = None,
+    search_mode: str = "text",
+    hosts: Optional[Sequence[str]] = None,
+) -> Tuple[str, List[Any]]:
+    if search and search_mode not in SEARCH_MODES:
+        raise ValueError(f"Invalid search mode '{search_mode}'. Allowed: {', '.join(SEARCH_MODES)}")
+    return LogQuery(
+        types=log_types,
+        hosts=hosts,
+        since=since,
+        until=until,
+        text=search if search_mode == "text" else None,
+        contains=search if search_mode == "substring" else None,
+        regex=search if search_mode == "regex" else None,
+        cursor=(before_created_at, before_id),
+    ).compile()
+
+@timed("db_call_seconds", fn="query_logs")
+def query_logs(q: LogQuery) -> List[Dict[str, Any]]:
+    query, params = q.compile()
+
+    def _do():
+        with get_conn() as conn, conn.cursor() as cur:
+            _execute(cur, query, params)
+            rows = cur.fetchall() or []
+            return [dict(r) for r in rows]
+    try:
+        return _with_retry(_do)
+    except InvalidRegularExpression as e:
+        raise ValueError(f"Invalid regex: {str(e).strip()}") from None
+
+@timed("db_call_seconds", fn="fetch_logs")
+def fetch_logs(
+    log_types: Optional[Sequence[str]] = None,
+    limit: int = 500,
+    before_created_at: Any = None,
+    before_id: Optional[int] = None,
+    since: Any = None,
+    until: Any = None,
+    hosts: Optional[Sequence[str]] = None,
+) -> List[Dict[str, Any]]:
+    key = (tuple(log_types) if log_types else None, limit, before_created_at, before_id, since, until, tuple(hosts) if hosts else None)
+    cached = FETCH_CACHE.get(key)
+    if cached is not None:
+        return cached
+    generation = FETCH_CACHE.generation
+    query, params = build_fetch_query(log_types, before_created_at, before_id, since, until, hosts=hosts)
+
+    def _do():
+        with get_conn() as conn, conn.cursor() as cur:
+            _execute(cur, query + " LIMIT %s", (*params, limit))
+            rows = cur.fetchall() or []
+            return [dict(r) for r in rows]
+    rows = _with_retry(_do)
+    FETCH_CACHE.put(key, rows, generation)
+    return rows
+
+@timed("db_call_seconds", count="db_rows_read_total", fn="iter_logs")
+def iter_logs(
+    log_types: Optional[Sequence[str]] = None,
+    before_created_at: Any = None,
+    before_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    itersize: int = PG_ITERSIZE,
+    since: Any = None,
+    until: Any = None,
+    hosts: Optional[Sequence[str]] = None,
+) -> Iterator[Dict[str, Any]]:
+    query, params = build_fetch_query(log_types, before_created_at, before_id, since, until, hosts=hosts)
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    with get_conn() as conn:
+        cur = conn.cursor(name=f"tl_iter_{uuid.uuid4().hex}")
+        cur.itersize = max(1, itersize)
+        try:
+            cur.execute(query, params)
+            for row in cur:
+                yield dict(row)
+        finally:
+            cur.close()
+            conn.rollback()
+
+@timed("db_call_seconds", fn="search_logs")
+def search_logs(
+    query: str,
+    types: Optional[Sequence[str]] = None,
+    since: Any = None,
+    until: Any = None,
+    limit: int = 100,
+    mode: str = "text",
+    hosts: Optional[Sequence[str]] = None,
+) -> List[Dict[str, Any]]:
+    if not query or not query.strip():
+        raise ValueError("Search query is empty!")
+    sql_text, params = build_fetch_query(types, None, None, since, until, query.strip(), mode, hosts)
+
+    def _do():
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(sql_text + " LIMIT %s", (*params, limit))
+            rows = cur.fetchall() or []
+            return [dict(r) for r in rows]
+    try:
+        return _with_retry(_do)
+    except InvalidRegularExpression as e:
+        raise ValueError(f"Invalid regex: {str(e).strip()}") from None
+
+@timed("db_call_seconds", fn="fetch_stats")
+def fetch_stats(
+    bucket: str = "hour",
+    since: Any = None,
+    until: Any = None,
+    log_types: Optional[Sequence[str]] = None,
+    hosts: Optional[Sequence[str]] = None,
+    group_by: Sequence[str] = ROLLUP_GROUPS,
+) -> List[Dict[str, Any]]:
+    if bucket not in ROLLUP_BUCKETS:
+        raise ValueError(f"Invalid bucket '{bucket}'. Allowed: {', '.join(ROLLUP_BUCKETS)}")
+    bad = [g for g in group_by if g not in ROLLUP_GROUPS]
+    if bad:
+        raise ValueError(f"Invalid group_by '{bad[0]}'. Allowed: {', '.join(ROLLUP_GROUPS)}")
+    #unmerged deltas are folded in at read time so counts are exact between merges
+    table = sql.SQL("""(
+        SELECT bucket, log_type, hostname, count FROM {rollup}
+        UNION ALL
+        SELECT date_bin({width}, bucket, TIMESTAMPTZ 'epoch'), log_type, hostname, count FROM log_rollup_delta
+    ) r""").format(
+        rollup=sql.Identifier("log_rollup_minute" if bucket == "minute" else "log_rollup_hour"),
+        width=sql.Literal("1 minute" if bucket == "minute" else "1 hour"),
+    )
+    bucket_sql = sql.SQL("date_bin('1 day', bucket, TIMESTAMPTZ 'epoch')") if bucket == "day" else sql.SQL("bucket")
+    groups = [sql.Identifier(g) for g in dict.fromkeys(group_by)]
+    clauses: List[sql.Composable] = []
+    params: List[Any] = []
+    if since is not None:
+        clauses.append(sql.SQL("bucket >= {}").format(sql.SQL("date_bin('1 day', %s::timestamptz, TIMESTAMPTZ 'epoch')") if bucket == "day" else sql.SQL("%s")))
+        params.append(since)
+    if until is not None:
+        clauses.append(sql.SQL("bucket < %s"))
+        params.append(until)
+    if log_types:
+        clauses.append(sql.SQL("log_type = ANY(%s)"))
+        params.append(list(log_types))
+    if hosts:
+        clauses.append(sql.SQL("hostname = ANY(%s)"))
+        params.append(list(hosts))
+    query = sql.SQL("""
+        SELECT {bucket} AS bucket{groups}, sum(count)::bigint AS count
+        FROM {table}
+        {where}
+        GROUP BY {group_cols}
+        ORDER BY {group_cols}
+    """).format(
+        bucket=bucket_sql,
+        groups=sql.SQL("").join(sql.SQL(", ") + g for g in groups),
+        table=table,
+        where=sql.SQL("WHERE ") + sql.SQL(" AND ").join(clauses) if clauses else sql.SQL(""),
+        group_cols=sql.SQL(", ").join([sql.SQL("1")] + groups),
+    )
+
+    def _do():
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall() or []
+            return [dict(r) for r in rows]
+    return _with_retry(_do)
+
+@timed("db_call_seconds", fn="fetch_logs_since_id")
+def fetch_logs_since_id(last_id: int, limit: int = 1000) -> List[Dict[str, Any]]:
+    def _do():
+        with get_conn() as conn, conn.cursor() as cur:
+            _execute(
+                cur,
+                f"""
+                {_SELECT_LOGS}
+                WHERE id > %s
+                ORDER BY id ASC
+                LIMIT %s
+                """,
+                (last_id, limit)
+            )
             rows = cur.fetchall() or []
             return [dict(r) for r in rows]
     return _with_retry(_do)
 
+@timed("db_call_seconds", fn="max_log_id")
+def max_log_id() -> int:
+    def _do():
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute("SELECT COALESCE(max(id), 0) AS max_id FROM logs;")
+            row = cur.fetchone()
+            conn.commit()
+            return int(row["max_id"])
+    return _with_retry(_do)
+
+class LogListener:
+    def __init__(self, channel: str = PG_NOTIFY_CHANNEL) -> None:
+        self.channel = channel
+        self._conn = None
+
+    def _connect(self) -> None:
+        self._conn = psycopg2.connect(_dsn())
+        self._conn.autocommit = True
+        with self._conn.cursor() as cur:
+            cur.execute(sql.SQL("LISTEN {};").format(sql.Identifier(self.channel)))
+        logger.info("Listening for new logs on channel '%s'.", self.channel)
+
+    def wait(self, timeout: float = 1.0) -> List[str]:
+        if self._conn is None or self._conn.closed:
+            self._connect()
+        if select.select([self._conn], [], [], timeout) == ([], [], []):
+            return []
+        self._conn.poll()
+        payloads = [n.payload for n in self._conn.notifies]
+        self._conn.notifies.clear()
+        return payloads
+
+    def close(self) -> None:
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
+        self._conn = None
+
+class FetchCache:
+    def __init__(self, size: int = PG_FETCH_CACHE_SIZE, ttl: float = PG_FETCH_CACHE_TTL) -> None:
+        self.size = size
+        self.ttl = ttl
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._listening = False
+        self._watcher: Optional[threading.Thread] = None
+
+    def enabled(self) -> bool:
+        return self.size > 0 and self.ttl > 0
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[List[Dict[str, Any]]]:
+        if not self.enabled():
+            return None
+        self._watch()
+        with self._lock:
+            entry = self._entries.get(key) if self._listening else None
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                inc("fetch_cache_misses_total")
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        inc("fetch_cache_hits_total")
+        return [dict(r) for r in entry[1]]
+
+    def put(self, key: Tuple[Any, ...], rows: List[Dict[str, Any]], generation: int) -> None:
+        if not self.enabled():
+            return
+        with self._lock:
+            if generation != self.generation or not self._listening:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, [dict(r) for r in rows])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.generation += 1
+            if self._entries:
+                self._entries.clear()
+                self._invalidations += 1
+                inc("fetch_cache_invalidations_total")
+
+    def _watch(self) -> None:
+        if self._watcher is not None:
+            return
+        with self._lock:
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._listen, name="FetchCacheListener", daemon=True)
+                self._watcher.start()
+
+    def _listen(self) -> None:
+        listener = LogListener()
+        while True:
+            try:
+                payloads = listener.wait(1.0 if self._listening else 0.0)
+                self._listening = True
+                if payloads:
+                    self.invalidate()
+            except Exception as e:
+                if self._listening:
+                    logger.warning("Fetch cache lost its NOTIFY listener, caching paused: %s", e)
+                self._listening = False
+                self.invalidate()
+                listener.close()
+                time.sleep(1.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled(),
+                "size": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+            }
+
+FETCH_CACHE = FetchCache()
+
+def fetch_cache_stats() -> Dict[str, Any]:
+    return FETCH_CACHE.stats()
+
+register_collector("fetch_cache", fetch_cache_stats)
+
+@timed("db_call_seconds", fn="healthcheck")
 def healthcheck() -> Tuple[bool, str]:
     try:
         def _do():
@@ -169,10 +1330,12 @@ def healthcheck() -> Tuple[bool, str]:
     except Exception as e:
         return False, f"Database connection failed: {e} !"
 
+@timed("db_call_seconds", fn="reset_log_table")
 def reset_log_table() -> None:
     def _do():
         with get_conn() as conn, conn.cursor() as cur:
-            cur.execute("TRUNCATE TABLE logs RESTART IDENTITY;")
+            cur.execute("TRUNCATE TABLE logs, log_rollup_minute, log_rollup_hour, log_rollup_delta RESTART IDENTITY;")
             conn.commit()
-            logger.info("Log table reset and ID counter restarted.")
+            FETCH_CACHE.invalidate()
+            logger.info("Log table and rollups reset, ID counter restarted.")
     _with_retry(_do)
\ No newline at end of file
@@ -1,50 +1,172 @@
 from __future__ import annotations
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
 from ttkbootstrap import Style
-from ttkbootstrap.dialogs import Querybox
-from typing import List
+from typing import Any, Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from datetime import timedelta
+from pathlib import Path
+import threading
 from logger import LogManager, VALID_LOG_TYPES
-from save import export_json, export_csv, export_pdf, export_docx
-from client_api import fetch_logs_from_api
+from database import SEARCH_MODES, ROLLUP_BUCKETS
+from save import export_json, export_ndjson, export_csv, export_pdf, export_docx, REPORT_LARGE_THRESHOLD, REPORT_SAMPLE_SIZE
+from client_api import LogApiClient, API_STATE_PATH, API_MAX_WORKERS, api_error_message
+from widgets import VirtualLogView, VirtualStatsView
+from tasks import TaskRunner, TaskCancelled
+from archive import archive_available
+from uis import utcnow
+import metrics
+
+STATS_MINUTE_MAX_HOURS = 24 * 7 #beyond this a minute view is hundreds of thousands of buckets
 
 class LogManagerApp:
-    def __init__(self, root: tk.Tk):
-        self.manager = LogManager()
+    def __init__(self, root: tk.Tk, on_ready: Optional[Callable[[bool], None]] = None):
+        self.manager = LogManager(connect=False)
+        self.api_client = LogApiClient(state_path=API_STATE_PATH)
 
         self.root = root
         self.root.title("TungLogger - Log Manager Pro Application")
         self.root.geometry("1500x750")
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
         self.style = Style("darkly")
         self.dark_mode = True
+        self.tasks = TaskRunner(self.root)
+        self._ready = False
+        self._db_actions: List[ttk.Widget] = []
 
         self.nb = ttk.Notebook(self.root)
         self.tab_logs = ttk.Frame(self.nb)
         self.tab_export = ttk.Frame(self.nb)
         self.tab_api = ttk.Frame(self.nb)
+        self.tab_stats = ttk.Frame(self.nb)
         self.nb.add(self.tab_logs, text="Logs")
         self.nb.add(self.tab_export, text="Export")
         self.nb.add(self.tab_api, text="API")
+        self.nb.add(self.tab_stats, text="Stats")
         self.nb.pack(expand=True, fill="both")
 
         self._build_logs_tab()
         self._build_export_tab()
         self._build_api_tab()
+        self._build_stats_tab()
         self._build_statusbar()
         self._apply_hover()
 
-        ok, msg, _ = self.manager.refresh_from_db(limit=1000)
-        self._status(msg)
-        self._refresh_tree(self.manager.logs)
+        self._set_ready(False)
+        self._startup_load(1000, on_ready)
+
+    def _gate(self, widget: ttk.Widget) -> ttk.Widget:
+        self._db_actions.append(widget)
+        return widget
+
+    def _set_ready(self, ready: bool):
+        self._ready = ready
+        for widget in self._db_actions:
+            widget.state(["!disabled"] if ready else ["disabled"])
+
+    def _startup_load(self, limit: int, on_ready: Optional[Callable[[bool], None]]):
+        def _work(h):
+            ok, msg = self.manager.connect()
+            return self.manager.refresh_from_db(limit=limit) if ok else (False, msg, [])
+
+        def _finish(ok: bool, msg: str):
+            if not ok and messagebox.askretrycancel("DB Error", msg):
+                self._startup_load(limit, on_ready)
+                return
+            self._set_ready(True) #a declined retry still unlocks the actions, each reports its own DB error
+            if on_ready is not None:
+                on_ready(ok)
+
+        def _done(result):
+            ok, msg, logs = result
+            self._status(msg)
+            if ok:
+                self._refresh_tree(logs)
+            _finish(ok, msg)
+
+        def _error(e):
+            _finish(False, str(e))
+
+        self._run_task("Refresh", _work, on_done=_done, on_error=_error)
 
     def _build_statusbar(self):
-        self.status = ttk.Label(self.root, text="Ready.", anchor="w")
-        self.status.pack(side="bottom", fill="x", padx=8, pady=4)
+        bar = ttk.Frame(self.root)
+        bar.pack(side="bottom", fill="x", padx=8, pady=4)
+        self.btn_cancel = ttk.Button(bar, text="Cancel", command=self.tasks.cancel)
+        self.progress = ttk.Progressbar(bar, length=220, mode="determinate")
+        self.status = ttk.Label(bar, text="Ready.", anchor="w")
+        self.status.pack(side="left", fill="x", expand=True)
+        if metrics.enabled():
+            self.metrics_label = ttk.Label(bar, text="", anchor="e")
+            self.metrics_label.pack(side="right", padx=(8, 0))
+            self._refresh_metrics()
+
+    def _refresh_metrics(self):
+        snap = metrics.snapshot()
+        db = [h for k, h in snap["histograms"].items() if k.startswith("db_call_seconds")]
+        p99 = max((h["p99"] for h in db), default=0.0)
+        gauges = snap["gauges"]
+        retries = sum(v for k, v in snap["counters"].items() if k.startswith("db_retries_total"))
+        self.metrics_label.config(
+            text=f"DB p99 {p99 * 1000:.1f} ms | pool {int(gauges.get('db_pool_in_use', 0))}/{int(gauges.get('db_pool_size', 0))} | retries {int(retries)}"
+        )
+        self.root.after(2000, self._refresh_metrics)
 
     def _status(self, text: str):
         print(text)
         self.status.config(text=text)
 
+    def _run_task(self, name: str, fn, *args, on_done=None, on_error=None, progress: bool = False):
+        def _done(result):
+            self._task_ended()
+            if on_done is not None:
+                on_done(result)
+
+        def _error(e):
+            self._task_ended()
+            if on_error is not None:
+                on_error(e)
+            else:
+                messagebox.showerror("Error", str(e))
+
+        def _cancelled():
+            self._task_ended()
+            self._status(f"{name} cancelled.")
+
+        handle = self.tasks.submit(
+            name, fn, *args,
+            on_done=_done, on_error=_error, on_cancel=_cancelled,
+            on_progress=self._on_progress if progress else None,
+        )
+        if handle is None:
+            self._status(f"{name} is already running…")
+            return
+        self._status(f"{name}…")
+        if progress:
+            self.progress.config(mode="indeterminate", value=0)
+            self.progress.pack(side="right", padx=(6, 0))
+            self.btn_cancel.pack(side="right", padx=(6, 0))
+            self.progress.start(15)
+
+    def _on_progress(self, done: int, total, text: str):
+        if total:
+            self.progress.stop()
+            self.progress.config(mode="determinate", maximum=total, value=done)
+        self._status(f"{text} {done}{f'/{total}' if total else ''}")
+
+    def _task_ended(self):
+        if not self.tasks.busy():
+            self.progress.stop()
+            self.progress.pack_forget()
+            self.btn_cancel.pack_forget()
+
+    def _on_close(self):
+        self.tasks.shutdown()
+        self.manager.close(timeout=2.0)
+        self.api_client.close()
+        self.root.destroy()
+
     def _apply_hover(self):
         def on_enter(e): e.widget.config(cursor="hand2")
         def on_leave(e): e.widget.config(cursor="")
@@ -65,23 +187,30 @@ class LogManagerApp:
         self.cmb_type = ttk.Combobox(top, values=list(VALID_LOG_TYPES), width=10, state="readonly")
         self.cmb_type.set("INFO")
         self.cmb_type.pack(side="left", padx=6)
-        ttk.Button(top, text="Save Log", command=self._save_log).pack(side="left", padx=6)
-        ttk.Button(top, text="Filter…", command=self._open_filter).pack(side="left", padx=6)
-        ttk.Button(top, text="Refresh", command=self._refresh_from_db).pack(side="left", padx=6)
+        self._gate(ttk.Button(top, text="Save Log", command=self._save_log)).pack(side="left", padx=6)
+        self._gate(ttk.Button(top, text="Filter…", command=self._open_filter)).pack(side="left", padx=6)
+        self._gate(ttk.Button(top, text="Refresh", command=self._refresh_from_db)).pack(side="left", padx=6)
+        self.var_live = tk.BooleanVar(value=False)
+        ttk.Checkbutton(top, text="Live tail", variable=self.var_live, command=self._toggle_live).pack(side="left", padx=6)
         ttk.Button(top, text="Toggle Theme", command=self._toggle_theme).pack(side="right")
 
-        self.tree = ttk.Treeview(full_frame, columns=("id", "type", "message", "host", "created"), show="headings")
-        self.tree.heading("id", text="ID")
-        self.tree.heading("type", text="Type")
-        self.tree.heading("message", text="Message")
-        self.tree.heading("host", text="Hostname")
-        self.tree.heading("created", text="Created At")
-        self.tree.column("id", width=60, anchor="center")
-        self.tree.column("type", width=90, anchor="center")
-        self.tree.column("message", width=450)
-        self.tree.column("host", width=160)
-        self.tree.column("created", width=180)
-        self.tree.pack(fill="both", expand=True)
+        search_bar = ttk.Frame(full_frame)
+        search_bar.pack(fill="x", pady=(0, 8))
+        ttk.Label(search_bar, text="Search:").pack(side="left")
+        self.ent_search = ttk.Entry(search_bar, width=60)
+        self.ent_search.pack(side="left", padx=6)
+        self.ent_search.bind("<Return>", lambda e: self._search() if self._ready else None)
+        self.cmb_search_mode = ttk.Combobox(search_bar, values=list(SEARCH_MODES), width=10, state="readonly")
+        self.cmb_search_mode.set("text")
+        self.cmb_search_mode.pack(side="left", padx=6)
+        self._gate(ttk.Button(search_bar, text="Search", command=self._search)).pack(side="left", padx=6)
+        self.var_archive = tk.BooleanVar(value=False)
+        if archive_available():
+            ttk.Checkbutton(search_bar, text="Include archive", variable=self.var_archive).pack(side="left", padx=6)
+            self._gate(ttk.Button(search_bar, text="Archive…", command=self._archive_old)).pack(side="right")
+
+        self.log_view = VirtualLogView(full_frame, on_need_more=self._load_more)
+        self.log_view.pack(fill="both", expand=True)
 
     def _save_log(self):
         msg = self.ent_msg.get().strip()
@@ -89,14 +218,18 @@ class LogManagerApp:
         if not msg:
             messagebox.showwarning("Validation", "Please enter a log message!")
             return
-        ok, feedback, rec = self.manager.add_log(msg, typ)
-        self._status(feedback)
-        if ok and rec:
-            messagebox.showinfo("Success", feedback)
-            self._refresh_tree([rec] + self.manager.logs)
-            self.ent_msg.delete(0, "end")
-        else:
-            messagebox.showerror("Error", feedback)
+
+        def _done(result):
+            ok, feedback, rec = result
+            self._status(feedback)
+            if ok and rec:
+                messagebox.showinfo("Success", feedback)
+                self._refresh_tree(self.manager.logs, keep_position=True)
+                self.ent_msg.delete(0, "end")
+            else:
+                messagebox.showerror("Error", feedback)
+
+        self._run_task("Save log", lambda h: self.manager.add_log(msg, typ), on_done=_done)
 
     def _open_filter(self):
         win = tk.Toplevel(self.root)
@@ -121,19 +254,95 @@ class LogManagerApp:
 
         ttk.Button(win, text="Apply", command=apply).pack(pady=10)
 
-    def _refresh_from_db(self):
-        ok, msg, logs = self.manager.refresh_from_db(limit=300)
-        self._status(msg)
-        if ok:
-            self._refresh_tree(logs)
+    def _search(self):
+        query = self.ent_search.get().strip()
+        if not query:
+            self._refresh_tree(self.manager.logs)
+            self._status(f"Search cleared ({len(self.manager.logs)} rows)")
+            return
+        mode = self.cmb_search_mode.get()
+
+        def _done(result):
+            ok, msg, found = result
+            self._status(msg)
+            if ok:
+                self._refresh_tree(found)
+            else:
+                messagebox.showerror("Search Error", msg)
+
+        if self.var_archive.get():
+            self._run_task("Search", lambda h: self.manager.query_all(text=query, limit=1000), on_done=_done)
         else:
-            messagebox.showerror("DB Error", msg)
+            self._run_task("Search", lambda h: self.manager.search(query, mode=mode, limit=1000), on_done=_done)
+
+    def _archive_old(self):
+        days = simpledialog.askinteger("Archive", "Move logs older than how many days to the archive?", minvalue=1, parent=self.root)
+        if not days:
+            return
+
+        def _done(result):
+            ok, msg, _ = result
+            self._status(msg)
+            if ok:
+                messagebox.showinfo("Archive", msg)
+                self._refresh_from_db()
+            else:
+                messagebox.showerror("Archive Error", msg)
+
+        self._run_task("Archive", lambda h: self.manager.archive_before(utcnow() - timedelta(days=days)), on_done=_done)
+
+    def _refresh_from_db(self):
+        self._load_logs(300)
+
+    def _load_logs(self, limit: int):
+        def _done(result):
+            ok, msg, logs = result
+            self._status(msg)
+            if ok:
+                self._refresh_tree(logs)
+            else:
+                messagebox.showerror("DB Error", msg)
+
+        self._run_task("Refresh", lambda h: self.manager.refresh_from_db(limit=limit), on_done=_done)
+
+    def _toggle_live(self):
+        if not self.var_live.get():
+            self.manager.stop_live_tail()
+            self._status("Live tail stopped.")
+            return
+
+        def _started(result):
+            ok, msg = result
+            self._status(msg)
+            if not ok:
+                self.var_live.set(False)
+                messagebox.showerror("Live Tail", msg)
+
+        self._run_task(
+            "Live tail",
+            lambda h: self.manager.start_live_tail(lambda recs: self.tasks.post(self._on_live_logs, recs)),
+            on_done=_started,
+        )
 
-    def _refresh_tree(self, records):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-        for r in records:
-            self.tree.insert("", "end", values=(r.id, r.log_type, r.log_message, r.hostname, str(r.created_at)))
+    def _on_live_logs(self, records):
+        self._status(f"Live: {len(records)} new logs ({records[-1].log_type}: {records[-1].log_message[:60]})")
+        if self.log_view.source is self.manager.logs:
+            self.log_view.refresh()
+
+    def _refresh_tree(self, records, keep_position: bool = False):
+        self.log_view.set_source(records, keep_position)
+
+    def _load_more(self):
+        if not self._ready or self.log_view.source is not self.manager.logs or not self.manager.has_more:
+            return
+
+        def _done(result):
+            ok, msg, page = result
+            self._status(msg)
+            if ok and page and self.log_view.source is self.manager.logs:
+                self.log_view.refresh()
+
+        self._run_task("Load more", lambda h: self.manager.fetch_next_page(), on_done=_done)
 
     def _toggle_theme(self):
         self.dark_mode = not self.dark_mode
@@ -146,74 +355,214 @@ class LogManagerApp:
 
         ttk.Label(full_frame, text="Save current list as…").pack(anchor="center", pady=(0, 8))
 
-        ttk.Button(full_frame, text="Export JSON", command=lambda: self._export("json")).pack(anchor="center", pady=6)
-        ttk.Button(full_frame, text="Export CSV",  command=lambda: self._export("csv")).pack(anchor="center", pady=6)
-        ttk.Button(full_frame, text="Export PDF",  command=lambda: self._export("pdf")).pack(anchor="center", pady=6)
-        ttk.Button(full_frame, text="Export DOCX", command=lambda: self._export("docx")).pack(anchor="center", pady=6)
+        self._gate(ttk.Button(full_frame, text="Export JSON", command=lambda: self._export("json"))).pack(anchor="center", pady=6)
+        self._gate(ttk.Button(full_frame, text="Export NDJSON", command=lambda: self._export("ndjson"))).pack(anchor="center", pady=6)
+        self._gate(ttk.Button(full_frame, text="Export CSV",  command=lambda: self._export("csv"))).pack(anchor="center", pady=6)
+        self._gate(ttk.Button(full_frame, text="Export PDF",  command=lambda: self._export("pdf"))).pack(anchor="center", pady=6)
+        self._gate(ttk.Button(full_frame, text="Export DOCX", command=lambda: self._export("docx"))).pack(anchor="center", pady=6)
         ttk.Button(full_frame, text="Toggle Theme", command=self._toggle_theme).pack(side="right", padx=20, pady=100)
 
     def _export(self, kind: str):
-        logs = self.manager.to_list_of_dicts()
-        if not logs:
+        if not self.manager.logs:
             messagebox.showwarning("Export", "There are no logs to export!")
             return
         exts = {
-            "json": [("JSON", "*.json")],
-            "csv":  [("CSV", "*.csv")],
+            "json": [("JSON", "*.json"), ("JSON (gzip)", "*.json.gz"), ("JSON (zstd)", "*.json.zst")],
+            "ndjson": [("NDJSON", "*.ndjson"), ("NDJSON (gzip)", "*.ndjson.gz"), ("NDJSON (zstd)", "*.ndjson.zst")],
+            "csv":  [("CSV", "*.csv"), ("CSV (gzip)", "*.csv.gz"), ("CSV (zstd)", "*.csv.zst")],
             "pdf":  [("PDF", "*.pdf")],
             "docx": [("Word Document", "*.docx")],
         }
+        mode = "full"
+        if kind in ("pdf", "docx") and len(self.manager.logs) > REPORT_LARGE_THRESHOLD:
+            choice = messagebox.askyesnocancel(
+                "Large Export",
+                f"{len(self.manager.logs)} logs selected.\n\n"
+                f"Yes: summary report with a {REPORT_SAMPLE_SIZE}-log sample.\nNo: full report with every log.",
+            )
+            if choice is None:
+                return
+            mode = "summary" if choice else "full"
         path = filedialog.asksaveasfilename(defaultextension=f".{kind}", filetypes=exts.get(kind))
         if not path:
             return
-        try:
-            if kind == "json":
-                export_json(logs, path)
-            elif kind == "csv":
-                export_csv(logs, path)
-            elif kind == "pdf":
-                export_pdf(logs, path)
-            elif kind == "docx":
-                export_docx(logs, path)
+        records = self.manager.to_list_of_dicts()
+        exporters = {
+            "json": export_json,
+            "ndjson": export_ndjson,
+            "csv": export_csv,
+            "pdf": export_pdf,
+            "docx": export_docx,
+        }
+
+        def _work(handle):
+            logs = handle.track(records, len(records), f"Exporting {kind.upper()}")
+            try:
+                if kind in ("pdf", "docx"):
+                    return exporters[kind](logs, path, mode=mode)
+                return exporters[kind](logs, path)
+            except TaskCancelled:
+                Path(path).unlink(missing_ok=True)
+                raise
+
+        def _done(count):
             messagebox.showinfo("Export", f"Exported to {kind.upper()} successfully.")
-            self._status(f"Exported {len(logs)} logs to {path}.")
-        except Exception as e:
+            self._status(f"Exported {count} logs to {path}.")
+
+        def _error(e):
             messagebox.showerror("Export Error", str(e))
             self._status(f"Export failed: {e}")
 
+        self._run_task("Export", _work, on_done=_done, on_error=_error, progress=True)
+
+    def _build_stats_tab(self):
+        full_frame = ttk.Frame(self.tab_stats, padding=12)
+        full_frame.pack(fill="both", expand=True)
+
+        top = ttk.Frame(full_frame)
+        top.pack(fill="x", pady=(0, 8))
+        ttk.Label(top, text="Bucket:").pack(side="left")
+        self.cmb_stats_bucket = ttk.Combobox(top, values=list(ROLLUP_BUCKETS), width=8, state="readonly")
+        self.cmb_stats_bucket.set("hour")
+        self.cmb_stats_bucket.pack(side="left", padx=6)
+        ttk.Label(top, text="Last:").pack(side="left")
+        self.stats_ranges = {"1 hour": 1, "24 hours": 24, "7 days": 24 * 7, "30 days": 24 * 30, "365 days": 24 * 365}
+        self.cmb_stats_range = ttk.Combobox(top, values=list(self.stats_ranges), width=10, state="readonly")
+        self.cmb_stats_range.set("24 hours")
+        self.cmb_stats_range.pack(side="left", padx=6)
+        ttk.Label(top, text="Group by:").pack(side="left")
+        self.stats_groups = {"type": ("log_type",), "host": ("hostname",), "type + host": ("log_type", "hostname"), "total": ()}
+        self.cmb_stats_group = ttk.Combobox(top, values=list(self.stats_groups), width=12, state="readonly")
+        self.cmb_stats_group.set("type")
+        self.cmb_stats_group.pack(side="left", padx=6)
+        self._gate(ttk.Button(top, text="Load Stats", command=self._load_stats)).pack(side="left", padx=6)
+
+        self.lbl_stats_summary = ttk.Label(full_frame, text="", anchor="w")
+        self.lbl_stats_summary.pack(fill="x", pady=(0, 8))
+
+        self.stats_view = VirtualStatsView(full_frame)
+        self.stats_view.pack(fill="both", expand=True)
+
+    def _load_stats(self):
+        bucket = self.cmb_stats_bucket.get()
+        hours = self.stats_ranges[self.cmb_stats_range.get()]
+        if bucket == "minute" and hours > STATS_MINUTE_MAX_HOURS:
+            messagebox.showwarning("Stats", f"Minute buckets are limited to the last {STATS_MINUTE_MAX_HOURS // 24} days, pick hour or day for longer ranges.")
+            return
+        since = utcnow() - timedelta(hours=hours)
+        group_by = self.stats_groups[self.cmb_stats_group.get()]
+
+        def _done(result):
+            ok, msg, rows = result
+            self._status(msg)
+            if not ok:
+                messagebox.showerror("Stats Error", msg)
+                return
+            rows.reverse()
+            self.stats_view.set_source(rows)
+            totals = {}
+            for r in rows:
+                key = r.get("log_type") or r.get("hostname") or "total"
+                totals[key] = totals.get(key, 0) + r["count"]
+            summary = ", ".join(f"{k}: {v}" for k, v in sorted(totals.items(), key=lambda kv: -kv[1]))
+            self.lbl_stats_summary.config(text=f"{sum(totals.values())} logs in {len(rows)} buckets. {summary}")
+
+        self._run_task("Stats", lambda h: self.manager.stats(bucket, since=since, group_by=group_by), on_done=_done)
+
     def _build_api_tab(self):
         full_frame = ttk.Frame(self.tab_api, padding=16)
         full_frame.pack(fill="both", expand=True)
 
-        ttk.Label(full_frame, text="Server API Endpoint:").pack(anchor="center")
+        ttk.Label(full_frame, text="Server API Endpoints (comma separated):").pack(anchor="center")
         self.ent_api = ttk.Entry(full_frame, width=120)
         self.ent_api.pack(anchor="center", pady=(5, 10))
+        self.var_api_incremental = tk.BooleanVar(value=True)
+        ttk.Checkbutton(full_frame, text="Only fetch new logs", variable=self.var_api_incremental).pack(anchor="center", pady=(0, 10))
 
-        ttk.Button(full_frame, text="Fetch Logs", command=self._api_fetch).pack(anchor="center")
+        self._gate(ttk.Button(full_frame, text="Fetch Logs", command=self._api_fetch)).pack(anchor="center")
         ttk.Button(full_frame, text="Toggle Theme", command=self._toggle_theme).pack(side="right", padx=20, pady=100)
 
     def _api_fetch(self):
-        endpoint = self.ent_api.get().strip()
-        ok, msg, data = fetch_logs_from_api(endpoint)
-        self._status(msg)
-        if not ok:
-            messagebox.showerror("API Error", msg)
+        endpoints = [ep.strip() for ep in self.ent_api.get().replace("\n", ",").split(",") if ep.strip()]
+        if not endpoints:
+            messagebox.showerror("API Error", "API Endpoint is empty!")
             return
+        incremental = self.var_api_incremental.get()
+        valid_types = set(VALID_LOG_TYPES)
 
-        items = []
-        for row in data:
-            t = str(row.get("log_type", "INFO")).upper()
-            m = str(row.get("log_message", ""))
-            if t in set(VALID_LOG_TYPES) and m:
-                items.append((t, m))
-        if not items:
-            messagebox.showinfo("API", "Fetched data did not contain valid logs!")
-            return
+        def _work(handle):
+            handle.progress(0, None, "Fetching from API", force=True)
+            unique = list(dict.fromkeys(endpoints))
+            seen = [0]
+            lock = threading.Lock()
 
-        ok2, msg2, count = self.manager.add_logs_bulk(items)
-        self._status(msg2)
-        if ok2:
-            messagebox.showinfo("API", f"Imported {count} logs from API!")
-            self._refresh_from_db()
-        else:
-            messagebox.showerror("Error, API Import!", msg2)
\ No newline at end of file
+            def _import(ep):
+                state: Dict[str, Any] = {"mark": None, "error": None, "yielded": 0}
+                marks: deque = deque()
+
+                def _committed(count: int) -> None:
+                    mark = None
+                    while marks and marks[0][0] <= count:
+                        mark = marks.popleft()[1]
+                    if mark and incremental:
+                        self.api_client.advance(ep, mark)
+
+                def _items():
+                    try:
+                        for row, mark, resumable in self.api_client.iter_fetch(ep, incremental):
+                            state["mark"] = mark
+                            with lock:
+                                seen[0] += 1
+                                n = seen[0]
+                            if n % 500 == 0:
+                                handle.check()
+                                handle.progress(n, None, "Importing")
+                            t = str(row.get("log_type", "INFO")).upper()
+                            m = str(row.get("log_message", ""))
+                            if t in valid_types and m:
+                                state["yielded"] += 1
+                                if resumable:
+                                    marks.append((state["yielded"], mark))
+                                else:
+                                    marks.clear() #out of order, only a completed import may move the mark
+                                yield (t, m)
+                    except Exception as e:
+                        state["error"] = api_error_message(e)
+
+                imported = self.manager.add_logs_bulk(_items(), on_commit=_committed)
+                if imported[0] and incremental and state["mark"]:
+                    self.api_client.advance(ep, state["mark"])
+                return state["error"], imported
+
+            with ThreadPoolExecutor(max_workers=max(1, min(API_MAX_WORKERS, len(unique)))) as pool:
+                results = dict(zip(unique, pool.map(_import, unique)))
+            handle.check()
+            failed = {ep: err for ep, (err, _) in results.items() if err}
+            fetched = [ep for ep in unique if ep not in failed or results[ep][1][2]]
+            imports = [res for _, res in results.values()]
+            count = sum(res[2] for res in imports)
+            errors = [res[1] for res in imports if not res[0]]
+            if errors:
+                return failed, fetched, (False, errors[0], count)
+            if not count:
+                return failed, fetched, (True, "Fetched data did not contain new valid logs!", 0)
+            return failed, fetched, (True, f"Imported {count} logs!", count)
+
+        def _done(result):
+            failed, fetched, (ok2, msg2, count) = result
+            self._status(msg2)
+            if failed:
+                messagebox.showerror("API Error", "\n".join(f"{ep}: {err}" for ep, err in failed.items()))
+            if not fetched:
+                return
+            if not ok2:
+                messagebox.showerror("Error, API Import!", msg2)
+                if count:
+                    self._refresh_from_db()
+            elif count:
+                messagebox.showinfo("API", f"Imported {count} logs from API!")
+                self._refresh_from_db()
+            else:
+                messagebox.showinfo("API", msg2)
+
+        self._run_task("API import", _work, on_done=_done, progress=True)
@@ -0,0 +1,199 @@
+from __future__ import annotations
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+from datetime import datetime, timezone
+from collections import deque
+from database import insert_logs_bulk, insert_logs_replay, DB_UNAVAILABLE_ERRORS
+from spool import Spool
+from batcher import Row, BATCH_SIZE, BATCH_INTERVAL, BATCH_QUEUE_SIZE
+from uis import get_hostname
+import threading
+import logging
+import time
+import os
+
+log = logging.getLogger("Handler")
+
+if not log.handlers:
+    log.setLevel(logging.INFO)
+    _ch = logging.StreamHandler()
+    _ch.setFormatter(logging.Formatter("[%(levelname)s] Handler: %(message)s"))
+    log.addHandler(_ch)
+
+KeyedRow = Tuple[str, str, str, str, Any]
+
+HANDLER_POLICIES = ("drop-oldest", "drop-debug-first", "block")
+HANDLER_POLICY = os.getenv("LOG_HANDLER_POLICY", "drop-oldest")
+HANDLER_BLOCK_TIMEOUT = float(os.getenv("LOG_HANDLER_BLOCK_TIMEOUT", "5"))
+
+def level_to_type(levelno: int) -> str:
+    if levelno >= logging.ERROR:
+        return "ERROR"
+    if levelno >= logging.WARNING:
+        return "WARNING"
+    if levelno >= logging.INFO:
+        return "INFO"
+    return "DEBUG"
+
+class TungLogHandler(logging.Handler):
+    def __init__(
+        self,
+        level: int = logging.NOTSET,
+        policy: str = HANDLER_POLICY,
+        batch_size: int = BATCH_SIZE,
+        interval: float = BATCH_INTERVAL,
+        max_queue: int = BATCH_QUEUE_SIZE,
+        block_timeout: float = HANDLER_BLOCK_TIMEOUT,
+        hostname: Optional[str] = None,
+        write: Callable[[Iterable[Row]], int] = insert_logs_bulk,
+        spool: Optional[Spool] = None,
+        write_keyed: Callable[[Sequence[KeyedRow]], int] = insert_logs_replay,
+    ) -> None:
+        if policy not in HANDLER_POLICIES:
+            raise ValueError(f"Invalid policy '{policy}'. Allowed: {', '.join(HANDLER_POLICIES)}")
+        super().__init__(level)
+        self.policy = policy
+        self.batch_size = max(1, batch_size)
+        self.interval = max(0.01, interval)
+        self.max_queue = max(1, max_queue)
+        self.block_timeout = block_timeout
+        self.hostname = hostname or get_hostname()
+        self._write = write
+        self._write_keyed = write_keyed
+        self._spool = spool
+        if spool is not None:
+            spool.start()
+        self._main: Deque[Row] = deque()
+        self._debug: Deque[Row] = deque()
+        self._space = threading.Condition(threading.Lock())
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._stopping = False
+        self._counts = {"emitted": 0, "flushed": 0, "dropped": 0, "failed": 0, "spooled": 0}
+        self._counts_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="log-handler-flush", daemon=True)
+        self._thread.start()
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._counts_lock:
+            self._counts[key] += n
+
+    def stats(self) -> Dict[str, int]:
+        with self._counts_lock:
+            counts = dict(self._counts)
+        counts["pending"] = self.pending()
+        return counts
+
+    def pending(self) -> int:
+        return len(self._main) + len(self._debug)
+
+    def handle(self, record: logging.LogRecord) -> Any:
+        rv = self.filter(record)
+        if rv:
+            self.emit(rv if isinstance(rv, logging.LogRecord) else record)
+        return rv
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._stopping or threading.get_ident() == self._thread.ident:
+            return
+        try:
+            log_type = level_to_type(record.levelno)
+            row: Row = (log_type, self.format(record), self.hostname, datetime.fromtimestamp(record.created, timezone.utc))
+            if self.pending() >= self.max_queue and not self._make_room(log_type):
+                self._count("dropped")
+                return
+            (self._debug if log_type == "DEBUG" else self._main).append(row)
+            self._count("emitted")
+            if self.pending() >= self.batch_size:
+                self._wake.set()
+        except Exception:
+            self.handleError(record)
+
+    def _make_room(self, log_type: str) -> bool:
+        if self.policy == "block":
+            with self._space:
+                self._wake.set()
+                return self._space.wait_for(lambda: self.pending() < self.max_queue, self.block_timeout)
+        try:
+            if self.policy == "drop-debug-first":
+                if self._debug:
+                    self._debug.popleft()
+                elif log_type == "DEBUG":
+                    return False
+                else:
+                    self._main.popleft()
+            elif self._main and (not self._debug or self._main[0][3] <= self._debug[0][3]):
+                self._main.popleft()
+            else:
+                self._debug.popleft()
+        except IndexError:
+            return True
+        self._count("dropped")
+        return True
+
+    def _drain(self) -> List[Row]:
+        batch: List[Row] = []
+        for source in (self._main, self._debug):
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(source.popleft())
+                except IndexError:
+                    break
+        if batch and self.policy == "block":
+            with self._space:
+                self._space.notify_all()
+        return batch
+
+    def _ship(self, batch: List[Row]) -> None:
+        if self._spool is None:
+            self._write(batch)
+            self._count("flushed", len(batch))
+            return
+        keys = self._spool.new_keys(len(batch)) #keyed before the first attempt so a lost commit ack replays as a duplicate
+        if not self._spool.breaker.open:
+            try:
+                self._write_keyed([(k, *r) for k, r in zip(keys, batch)])
+                self._spool.breaker.succeeded()
+                self._count("flushed", len(batch))
+                return
+            except DB_UNAVAILABLE_ERRORS:
+                self._spool.breaker.failed()
+        self._spool.append(batch, keys)
+        self._count("spooled", len(batch))
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self._idle.clear()
+            while True:
+                batch = self._drain()
+                if not batch:
+                    break
+                try:
+                    self._ship(batch)
+                except Exception as e:
+                    self._count("failed", len(batch))
+                    log.error("Failed to ship %d log records: %s", len(batch), e)
+                if len(batch) < self.batch_size:
+                    break
+            self._idle.set()
+            if self._stopping and not self.pending():
+                return
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        deadline = time.monotonic() + (self.block_timeout if timeout is None else timeout)
+        while self.pending() and self._thread.is_alive() and time.monotonic() < deadline:
+            self._wake.set()
+            time.sleep(0.01)
+        self._idle.wait(max(0.0, deadline - time.monotonic()))
+
+    def close(self) -> None:
+        if not self._stopping:
+            self._stopping = True
+            self._wake.set()
+            self._thread.join(timeout=self.block_timeout)
+            stats = self.stats()
+            if stats["dropped"] or stats["failed"] or stats["pending"]:
+                log.warning("Handler closed: %s", stats)
+        super().close()
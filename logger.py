@@ -1,9 +1,23 @@
 from __future__ import annotations
-from database import init_db, insert_log_row, insert_logs_bulk, fetch_logs, reset_log_table
-from typing import List, Optional, Sequence, Tuple, Dict, Any
-from dataclasses import dataclass, asdict
+from database import (
+    init_db, insert_log_row, insert_logs_bulk, insert_logs_bulk_returning, fetch_logs, iter_logs, search_logs, reset_log_table,
+    maintenance_tick, drop_partitions_before, PG_RETENTION_DAYS, PG_MAINTENANCE_INTERVAL, MAINTENANCE_TICK,
+    fetch_logs_since_id, max_log_id, delete_logs_before, log_range_before, fetch_stats, query_logs, LogQuery, LogListener, DB_UNAVAILABLE_ERRORS,
+    ROLLUP_GROUPS,
+)
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Dict, Any
+from concurrent.futures import Future
+from batcher import BatchWriter, BATCH_SIZE, BATCH_INTERVAL, BATCH_QUEUE_SIZE
+from datetime import datetime, timedelta
+from spool import Spool, SPOOL_ENABLED, default_spool
+from metrics import timed, inc
+from archive import ArchiveReader, archive_available, write_archive, ARCHIVE_DIR
+from store import LogRecord, LogStore, LOG_STORE_CAPACITY
 from uis import get_hostname, utcnow
+import threading
 import logging
+import heapq
+import time
 
 log = logging.getLogger("LogManager")
 
@@ -15,37 +29,160 @@ if not log.handlers:
 
 VALID_LOG_TYPES = ("INFO", "WARNING", "ERROR", "DEBUG")
 
-@dataclass
-class LogRecord:
-    id: Optional[int]
-    log_type: str
-    log_message: str
-    hostname: str
-    created_at: Any
-
-    def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
+LIVE_TAIL_BATCH = 1000
+LIVE_TAIL_FALLBACK_POLL = 30.0
 
 class LogManager:
-    def __init__(self) -> None:
-        init_db()
+    def __init__(
+        self,
+        buffered: bool = False,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = BATCH_INTERVAL,
+        max_queue: int = BATCH_QUEUE_SIZE,
+        capacity: int = LOG_STORE_CAPACITY,
+        spool: Optional[Spool] = None,
+        connect: bool = True,
+    ) -> None:
+        self._spool = spool if spool is not None else (default_spool() if SPOOL_ENABLED else None)
+        if connect:
+            try:
+                init_db()
+            except DB_UNAVAILABLE_ERRORS as e:
+                if self._spool is None:
+                    raise
+                log.warning("DB unavailable at startup, spooling until it is back: %s", e)
 
-        self.logs: List[LogRecord] = []
+        self._started = False
+        self.logs = LogStore(capacity)
         self.hostname = get_hostname()
+        self._writer: Optional[BatchWriter] = None
+        self._page_types: Optional[List[str]] = None
+        self._page_cursor: Optional[Tuple[Any, int]] = None
+        self._stop = threading.Event()
+        self._tail_stop = threading.Event()
+        self._tail: Optional[threading.Thread] = None
+        self._tail_local_ids: Set[int] = set()
+        self._maintenance: Optional[threading.Thread] = None
+        if buffered:
+            self._writer = BatchWriter(self._write_batch, batch_size, flush_interval, max_queue)
+        if connect:
+            self._start_background()
+
+    def _start_background(self) -> None:
+        #started only once the schema has been initialised (or found unreachable), never ahead of it
+        if self._started:
+            return
+        self._started = True
+        if self._spool is not None:
+            self._spool.start()
+        self._maintenance = threading.Thread(target=self._maintenance_loop, name="log-maintenance", daemon=True)
+        self._maintenance.start()
+
+    @timed("logmanager_call_seconds", fn="connect")
+    def connect(self) -> Tuple[bool, str]:
+        try:
+            init_db()
+            self._start_background()
+            msg = "Database connection ready!"
+            log.info(msg)
+            return True, msg
+        except Exception as e:
+            if self._spool is not None:
+                self._start_background()
+            err = f"Failed to connect to database: {e} !"
+            log.error(err)
+            return False, err
+
+    def _maintenance_loop(self) -> None:
+        due = time.monotonic() + PG_MAINTENANCE_INTERVAL
+        while not self._stop.wait(MAINTENANCE_TICK):
+            try:
+                due = maintenance_tick(due)
+            except DB_UNAVAILABLE_ERRORS as e:
+                log.warning("Maintenance skipped, DB unavailable: %s", e)
+            except Exception as e:
+                log.error("Partition maintenance failed: %s", e)
+
+    def _write_batch(self, rows: Sequence[Tuple[str, str, str, Any]]) -> List[Dict[str, Any]]:
+        if self._spool is None:
+            return insert_logs_bulk_returning(rows)
+        keys = self._spool.new_keys(len(rows)) #keyed before the first attempt so a lost commit ack replays as a duplicate
+        if not self._spool.breaker.open:
+            try:
+                inserted = insert_logs_bulk_returning(rows, attempts=1, ingest_keys=keys)
+                self._spool.breaker.succeeded()
+                return inserted
+            except DB_UNAVAILABLE_ERRORS as e:
+                self._spool.breaker.failed()
+                log.warning("DB unavailable, spooling %d logs locally: %s", len(rows), e)
+        self._spool.append(rows, keys)
+        return [{"id": None, "created_at": r[3]} for r in rows]
+
+    def _insert_or_spool(self, log_type: str, log_message: str, created_at: Any) -> Dict[str, Any]:
+        if self._spool is None:
+            return insert_log_row(log_type=log_type, log_message=log_message, hostname=self.hostname, created_at=created_at)
+        keys = self._spool.new_keys(1)
+        if not self._spool.breaker.open:
+            try:
+                record = insert_log_row(log_type, log_message, self.hostname, created_at, attempts=1, ingest_key=keys[0])
+                self._spool.breaker.succeeded()
+                return record
+            except DB_UNAVAILABLE_ERRORS as e:
+                self._spool.breaker.failed()
+                log.warning("DB unavailable, spooling log locally: %s", e)
+        self._spool.append([(log_type, log_message, self.hostname, created_at)], keys)
+        return {"id": None, "log_type": log_type, "log_message": log_message, "hostname": self.hostname, "created_at": created_at}
+
+    @property
+    def spool(self) -> Optional[Spool]:
+        return self._spool
+
+    @property
+    def buffered(self) -> bool:
+        return self._writer is not None
 
     def _validate_type(self, log_type: str) -> None:
         if log_type not in VALID_LOG_TYPES:
             raise ValueError(f"Invalid log_type '{log_type}'. "f"Allowed: {', '.join(VALID_LOG_TYPES)}")
 
+    @timed("logmanager_call_seconds", fn="submit_log")
+    def submit_log(self, log_message: str, log_type: str = "INFO", timeout: Optional[float] = None) -> "Future[LogRecord]":
+        _, result = self._enqueue(log_message, log_type, timeout)
+        return result
+
+    def _enqueue(self, log_message: str, log_type: str, timeout: Optional[float]) -> Tuple[LogRecord, "Future[LogRecord]"]:
+        self._validate_type(log_type)
+        if self._writer is None:
+            raise RuntimeError("Buffered mode is not enabled!")
+        log_rec = LogRecord(id=None, log_type=log_type, log_message=log_message, hostname=self.hostname, created_at=utcnow())
+        pending = self._writer.submit((log_rec.log_type, log_rec.log_message, log_rec.hostname, log_rec.created_at), timeout)
+        result: "Future[LogRecord]" = Future()
+        seq = self.logs.appendleft(log_rec)
+
+        def _resolve(f: Future) -> None:
+            try:
+                row = f.result()
+            except Exception as e:
+                result.set_exception(e)
+                return
+            log_rec.id = row["id"]
+            log_rec.created_at = row["created_at"]
+            self.logs.update(seq, log_rec.id, log_rec.created_at)
+            if self._tail is not None and log_rec.id is not None:
+                self._tail_local_ids.add(log_rec.id)
+            result.set_result(log_rec)
+
+        pending.add_done_callback(_resolve)
+        return log_rec, result
+
+    @timed("logmanager_call_seconds", fn="add_log")
     def add_log(self, log_message: str, log_type: str = "INFO") -> Tuple[bool, str, Optional[LogRecord]]:
         try:
             self._validate_type(log_type)
-            record = insert_log_row(
-                log_type=log_type,
-                log_message=log_message,
-                hostname=self.hostname,
-                created_at=utcnow()
-            )
+            if self._writer is not None:
+                log_rec, _ = self._enqueue(log_message, log_type, None)
+                return True, f"Queued log ({log_rec.log_type}) !", log_rec
+            record = self._insert_or_spool(log_type, log_message, utcnow())
             if not record or "id" not in record:
                 msg = "Insert returned no row.."
                 log.error(msg)
@@ -58,7 +195,14 @@ class LogManager:
                 hostname=record["hostname"],
                 created_at=record["created_at"],
             )
-            self.logs.insert(0, log_rec)
+            self.logs.appendleft(log_rec)
+            if log_rec.id is None:
+                inc("logmanager_spooled_total")
+                icl_msg = f"Spooled log ({log_rec.log_type}) locally, DB is unavailable!"
+                log.warning(icl_msg)
+                return True, icl_msg, log_rec
+            if self._tail is not None:
+                self._tail_local_ids.add(log_rec.id)
             icl_msg = f"Saved log #{log_rec.id} ({log_rec.log_type}) !"
             log.info(icl_msg)
             return True, icl_msg, log_rec
@@ -67,36 +211,59 @@ class LogManager:
             log.error(err)
             return False, err, None
 
-    def add_logs_bulk(self, items: Sequence[Tuple[str, str]]) -> Tuple[bool, str, int]:
+    @timed("logmanager_call_seconds", fn="add_logs_bulk")
+    def add_logs_bulk(
+        self,
+        items: Iterable[Tuple[str, str]],
+        on_commit: Optional[Callable[[int], None]] = None,
+    ) -> Tuple[bool, str, int]:
+        saved = [0]
+
+        def _saved(count: int) -> None:
+            saved[0] = count
+            if on_commit is not None:
+                on_commit(count)
         try:
-            for t, _ in items:
-                self._validate_type(t)
-            loader = [(t, m, self.hostname, utcnow()) for (t, m) in items]
-            count = insert_logs_bulk(loader)
+            if isinstance(items, (list, tuple)):
+                for t, _ in items:
+                    self._validate_type(t)
+                loader: Iterable[Tuple[str, str, str, Any]] = [(t, m, self.hostname, utcnow()) for (t, m) in items]
+            else:
+                loader = self._iter_bulk_rows(items)
+            count = insert_logs_bulk(loader, on_commit=_saved)
             msg = f"Inserted {count} logs!"
             log.info(msg)
             return True, msg, count
         except Exception as e:
-            err = f"Bulk insert failed: {e} !"
+            err = f"Bulk insert failed after saving {saved[0]} logs: {e} !" if saved[0] else f"Bulk insert failed: {e} !"
             log.error(err)
-            return False, err, 0
+            return False, err, saved[0]
+
+    def _iter_bulk_rows(self, items: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str, str, Any]]:
+        for t, m in items:
+            self._validate_type(t)
+            yield (t, m, self.hostname, utcnow())
 
-    def refresh_from_db(self, filter_types: Optional[Sequence[str]] = None, limit: int = 500) -> Tuple[bool, str, List[LogRecord]]:
+    @staticmethod
+    def _to_record(r: Dict[str, Any]) -> LogRecord:
+        return LogRecord(
+            id=r["id"],
+            log_type=r["log_type"],
+            log_message=r["log_message"],
+            hostname=r["hostname"],
+            created_at=r["created_at"],
+        )
+
+    @timed("logmanager_call_seconds", fn="refresh_from_db")
+    def refresh_from_db(self, filter_types: Optional[Sequence[str]] = None, limit: int = 500) -> Tuple[bool, str, Sequence[LogRecord]]:
         try:
             if filter_types:
                 for t in filter_types:
                     self._validate_type(t)
-            rows = fetch_logs(filter_types, limit)
-            self.logs = [
-                LogRecord(
-                    id=r["id"],
-                    log_type=r["log_type"],
-                    log_message=r["log_message"],
-                    hostname=r["hostname"],
-                    created_at=r["created_at"],
-                )
-                for r in rows
-            ]
+            rows = fetch_logs(filter_types, min(limit, self.logs.capacity))
+            self.logs.replace(self._to_record(r) for r in rows)
+            self._page_types = list(filter_types) if filter_types else None
+            self._page_cursor = (rows[-1]["created_at"], rows[-1]["id"]) if len(rows) >= limit else None
             msg = f"Fetched {len(self.logs)} logs from DB!"
             log.info(msg)
             return True, msg, self.logs
@@ -105,19 +272,283 @@ class LogManager:
             log.error(err)
             return False, err, []
 
-    def filter_local(self, types: Sequence[str]) -> List[LogRecord]:
-        lc_filter = [l for l in self.logs if l.log_type in set(types)]
-        return lc_filter
+    @property
+    def has_more(self) -> bool:
+        return self._page_cursor is not None
+
+    @timed("logmanager_call_seconds", fn="fetch_next_page")
+    def fetch_next_page(self, page_size: int = 500) -> Tuple[bool, str, List[LogRecord]]:
+        if self._page_cursor is None:
+            return True, "No more logs to fetch.", []
+        room = self.logs.capacity - len(self.logs)
+        if room <= 0:
+            return True, f"Local store is full ({self.logs.capacity} logs)!", []
+        try:
+            before_created_at, before_id = self._page_cursor
+            rows = fetch_logs(self._page_types, min(page_size, room), before_created_at, before_id)
+            page = [self._to_record(r) for r in rows]
+            self.logs.extend(page)
+            self._page_cursor = (rows[-1]["created_at"], rows[-1]["id"]) if len(rows) >= min(page_size, room) else None
+            msg = f"Fetched {len(page)} more logs from DB ({len(self.logs)} loaded)!"
+            log.info(msg)
+            return True, msg, page
+        except Exception as e:
+            err = f"Failed to fetch next page: {e} !"
+            log.error(err)
+            return False, err, []
+
+    def iter_from_db(self, filter_types: Optional[Sequence[str]] = None, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        if filter_types:
+            for t in filter_types:
+                self._validate_type(t)
+        return iter_logs(filter_types, limit=limit)
+
+    @timed("logmanager_call_seconds", fn="search")
+    def search(
+        self,
+        query: str,
+        types: Optional[Sequence[str]] = None,
+        since: Any = None,
+        until: Any = None,
+        limit: int = 200,
+        mode: str = "text",
+    ) -> Tuple[bool, str, List[LogRecord]]:
+        try:
+            if types:
+                for t in types:
+                    self._validate_type(t)
+            rows = search_logs(query, types, since, until, limit, mode)
+            found = [self._to_record(r) for r in rows]
+            msg = f"Found {len(found)} logs matching '{query}'!"
+            log.info(msg)
+            return True, msg, found
+        except Exception as e:
+            err = f"Search failed: {e} !"
+            log.error(err)
+            return False, err, []
+
+    @timed("logmanager_call_seconds", fn="query")
+    def query(self, q: LogQuery) -> Tuple[bool, str, List[LogRecord]]:
+        try:
+            if q.types:
+                for t in q.types:
+                    self._validate_type(t)
+            found = [self._to_record(r) for r in query_logs(q)]
+            msg = f"Query returned {len(found)} logs!"
+            log.info(msg)
+            return True, msg, found
+        except Exception as e:
+            err = f"Query failed: {e} !"
+            log.error(err)
+            return False, err, []
+
+    @timed("logmanager_call_seconds", fn="stats")
+    def stats(
+        self,
+        bucket: str = "hour",
+        since: Any = None,
+        until: Any = None,
+        types: Optional[Sequence[str]] = None,
+        hosts: Optional[Sequence[str]] = None,
+        group_by: Sequence[str] = ROLLUP_GROUPS,
+    ) -> Tuple[bool, str, List[Dict[str, Any]]]:
+        try:
+            if types:
+                for t in types:
+                    self._validate_type(t)
+            rows = fetch_stats(bucket, since, until, types, hosts, group_by)
+            msg = f"Loaded {len(rows)} {bucket} buckets ({sum(r['count'] for r in rows)} logs)!"
+            log.info(msg)
+            return True, msg, rows
+        except Exception as e:
+            err = f"Failed to load stats: {e} !"
+            log.error(err)
+            return False, err, []
+
+    @timed("logmanager_call_seconds", fn="archive_before")
+    def archive_before(self, cutoff: datetime, delete: bool = True, root: str = ARCHIVE_DIR) -> Tuple[bool, str, int]:
+        try:
+            bounds = log_range_before(cutoff)
+            if bounds["max_id"] is None:
+                return True, f"No logs older than {cutoff:%Y-%m-%d %H:%M} to archive!", 0
+            hi = bounds["max_id"]
+            tag = f"{bounds['min_id']}-{hi}-{round(bounds['min_created'].timestamp() * 1e6)}" #same rows on a rerun, same files
+            written = write_archive((r for r in iter_logs(until=cutoff) if r["id"] <= hi), root, tag=tag)
+            deleted = delete_logs_before(cutoff, hi) if delete and written["rows"] else 0
+            msg = f"Archived {written['rows']} logs older than {cutoff:%Y-%m-%d %H:%M}, removed {deleted} from DB!"
+            log.info(msg)
+            return True, msg, written["rows"]
+        except Exception as e:
+            err = f"Failed to archive logs: {e} !"
+            log.error(err)
+            return False, err, 0
+
+    @timed("logmanager_call_seconds", fn="query_all")
+    def query_all(
+        self,
+        types: Optional[Sequence[str]] = None,
+        hosts: Optional[Sequence[str]] = None,
+        since: Any = None,
+        until: Any = None,
+        text: Optional[str] = None,
+        limit: int = 1000,
+        root: str = ARCHIVE_DIR,
+    ) -> Tuple[bool, str, List[LogRecord]]:
+        try:
+            if types:
+                for t in types:
+                    self._validate_type(t)
+            text = text.strip() if text else None
+            if text:
+                live = search_logs(text, types, since, until, limit, "substring", hosts)
+            else:
+                live = fetch_logs(types, limit, since=since, until=until, hosts=hosts)
+            archived = ArchiveReader(root).query(types, hosts, since, until, text, limit) if archive_available() else []
+            key = lambda r: (r["created_at"], r["id"])
+            seen: Set[Tuple[int, Any]] = set()
+            found: List[LogRecord] = []
+            for r in heapq.merge(live, archived, key=key, reverse=True):
+                if (r["id"], r["created_at"]) in seen: #ids restart after reset_log_table
+                    continue
+                seen.add((r["id"], r["created_at"]))
+                found.append(self._to_record(r))
+                if len(found) >= limit:
+                    break
+            msg = f"Found {len(found)} logs ({len(live)} live, {len(archived)} archived)!"
+            log.info(msg)
+            return True, msg, found
+        except Exception as e:
+            err = f"Combined query failed: {e} !"
+            log.error(err)
+            return False, err, []
+
+    @property
+    def live_tail_running(self) -> bool:
+        return self._tail is not None
+
+    def start_live_tail(self, on_new: Callable[[List[LogRecord]], None]) -> Tuple[bool, str]:
+        if self._tail is not None:
+            return True, "Live tail is already running."
+        try:
+            last_seen = self.logs.max_id() or max_log_id()
+        except Exception as e:
+            err = f"Failed to start live tail: {e} !"
+            log.error(err)
+            return False, err
+        self._tail_stop.clear()
+        self._tail_local_ids.clear()
+        self._tail = threading.Thread(target=self._tail_loop, args=(on_new, last_seen), name="log-live-tail", daemon=True)
+        self._tail.start()
+        msg = f"Live tail started after log #{last_seen}!"
+        log.info(msg)
+        return True, msg
+
+    def stop_live_tail(self) -> None:
+        if self._tail is None:
+            return
+        self._tail_stop.set()
+        self._tail.join(timeout=5.0)
+        self._tail = None
+        log.info("Live tail stopped.")
+
+    def _tail_loop(self, on_new: Callable[[List[LogRecord]], None], last_seen: int) -> None:
+        listener = LogListener()
+        last_poll = 0.0
+        try:
+            while not self._tail_stop.is_set():
+                try:
+                    payloads = listener.wait(1.0)
+                except Exception as e:
+                    log.error("Live tail listener failed, reconnecting: %s", e)
+                    listener.close()
+                    self._tail_stop.wait(2.0)
+                    continue
+                now = time.monotonic()
+                newest = max((int(p) for p in payloads if p.isdigit()), default=None)
+                if now - last_poll < LIVE_TAIL_FALLBACK_POLL and (newest is None or newest <= last_seen):
+                    continue
+                last_poll = now
+                try:
+                    last_seen = self._tail_fetch(on_new, last_seen)
+                except Exception as e:
+                    log.error("Live tail fetch failed: %s", e)
+        finally:
+            listener.close()
+
+    def _tail_fetch(self, on_new: Callable[[List[LogRecord]], None], last_seen: int) -> int:
+        while True:
+            rows = fetch_logs_since_id(last_seen, LIVE_TAIL_BATCH)
+            if not rows:
+                return last_seen
+            last_seen = rows[-1]["id"]
+            fresh = [self._to_record(r) for r in rows if r["id"] not in self._tail_local_ids]
+            self._tail_local_ids.difference_update(r["id"] for r in rows)
+            if fresh:
+                self.logs.extendleft(fresh)
+                on_new(fresh)
+            if len(rows) < LIVE_TAIL_BATCH:
+                return last_seen
+
+    @timed("logmanager_call_seconds", fn="filter_local")
+    def filter_local(
+        self,
+        types: Optional[Sequence[str]] = None,
+        hosts: Optional[Sequence[str]] = None,
+        since: Any = None,
+        until: Any = None,
+    ) -> List[LogRecord]:
+        return self.logs.filter(types, hosts, since, until)
+
+    @timed("logmanager_call_seconds", fn="to_list_of_dicts")
+    def to_list_of_dicts(self, source: Optional[Sequence[LogRecord]] = None) -> List[Dict[str, Any]]:
+        if source is None or source is self.logs:
+            return self.logs.to_dicts()
+        return [l.to_dict() for l in source]
+
+    @timed("logmanager_call_seconds", fn="flush")
+    def flush(self, timeout: Optional[float] = None) -> Tuple[bool, str]:
+        if self._writer is None:
+            return True, "Nothing to flush."
+        try:
+            self._writer.flush(timeout)
+            msg = "Buffered logs flushed!"
+            log.info(msg)
+            return True, msg
+        except Exception as e:
+            err = f"Failed to flush logs: {e} !"
+            log.error(err)
+            return False, err
+
+    @timed("logmanager_call_seconds", fn="apply_retention")
+    def apply_retention(self, days: int = PG_RETENTION_DAYS) -> Tuple[bool, str]:
+        try:
+            if days <= 0:
+                return False, "Retention days must be positive!"
+            dropped = drop_partitions_before(utcnow() - timedelta(days=days))
+            msg = f"Retention applied ({days} days), dropped {len(dropped)} partitions!"
+            log.info(msg)
+            return True, msg
+        except Exception as e:
+            err = f"Failed to apply retention: {e} !"
+            log.error(err)
+            return False, err
 
-    def to_list_of_dicts(self, source: Optional[List[LogRecord]] = None) -> List[Dict[str, Any]]:
-        lsdc_rec = source if source is not None else self.logs
-        return [l.to_dict() for l in lsdc_rec]
+    def close(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self.stop_live_tail()
+        if self._writer is not None:
+            try:
+                self._writer.close(timeout)
+                self._writer = None
+            except TimeoutError as e:
+                log.warning("Buffered writer did not stop in time: %s", e)
 
+    @timed("logmanager_call_seconds", fn="reset_logs")
     def reset_logs(self) -> Tuple[bool, str]:
         try:
             reset_log_table()
             self.logs.clear()
-            msg = "Log table and ID counter successfully reset!"
+            msg = "Log table, rollups and ID counter successfully reset!"
             log.info(msg)
             return True, msg
         except Exception as e:
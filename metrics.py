@@ -0,0 +1,207 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+from bisect import bisect_left
+import functools
+import inspect
+import threading
+import time
+import os
+
+METRICS_ENABLED = os.getenv("LOG_METRICS", "0") == "1"
+METRICS_PREFIX = "tunglogger_"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000, 100000)
+
+F = TypeVar("F", bound=Callable[..., Any])
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class _State:
+    enabled = METRICS_ENABLED
+
+_STATE = _State()
+
+def enabled() -> bool:
+    return _STATE.enabled
+
+def enable(on: bool = True) -> None:
+    _STATE.enabled = on
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+        return self.buckets[-1]
+
+class Registry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+    def inc(self, name: str, value: float = 1, labels: LabelKey = ()) -> None:
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name: str, value: float, labels: LabelKey = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(labels)
+            if hist is None:
+                hist = series[labels] = Histogram(self._buckets.setdefault(name, buckets))
+            hist.observe(value)
+
+    def register_collector(self, name: str, fn: Callable[[], Dict[str, float]]) -> None:
+        with self._lock:
+            self._collectors[name] = fn
+
+    def _collect(self) -> Dict[str, float]:
+        gauges: Dict[str, float] = {}
+        for name, fn in list(self._collectors.items()):
+            try:
+                for key, value in fn().items():
+                    if isinstance(value, (int, float)):
+                        gauges[f"{name}_{key}"] = float(value)
+            except Exception:
+                continue
+        return gauges
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {_series_name(n, k): v for n, s in self._counters.items() for k, v in s.items()}
+            histograms = {
+                _series_name(n, k): {
+                    "count": h.count,
+                    "sum": round(h.sum, 6),
+                    "p50": h.quantile(0.5),
+                    "p99": h.quantile(0.99),
+                }
+                for n, s in self._histograms.items() for k, h in s.items()
+            }
+        return {"enabled": _STATE.enabled, "counters": counters, "histograms": histograms, "gauges": self._collect()}
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = f"{METRICS_PREFIX}{name}"
+                lines.append(f"# TYPE {full} counter")
+                for labels, value in series.items():
+                    lines.append(f"{full}{_fmt_labels(labels)} {_fmt(value)}")
+            for name, series in sorted(self._histograms.items()):
+                full = f"{METRICS_PREFIX}{name}"
+                lines.append(f"# TYPE {full} histogram")
+                for labels, hist in series.items():
+                    cumulative = 0
+                    for bound, n in zip(hist.buckets, hist.counts):
+                        cumulative += n
+                        lines.append(f"{full}_bucket{_fmt_labels(labels + (('le', _fmt(bound)),))} {cumulative}")
+                    lines.append(f"{full}_bucket{_fmt_labels(labels + (('le', '+Inf'),))} {hist.count}")
+                    lines.append(f"{full}_sum{_fmt_labels(labels)} {_fmt(hist.sum)}")
+                    lines.append(f"{full}_count{_fmt_labels(labels)} {hist.count}")
+        for name, value in sorted(self._collect().items()):
+            full = f"{METRICS_PREFIX}{name}"
+            lines.append(f"# TYPE {full} gauge")
+            lines.append(f"{full} {_fmt(value)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+def _fmt(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+def _fmt_labels(labels: LabelKey) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+def _series_name(name: str, labels: LabelKey) -> str:
+    return name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+
+REGISTRY = Registry()
+
+def inc(name: str, value: float = 1, **labels: str) -> None:
+    if _STATE.enabled:
+        REGISTRY.inc(name, value, tuple(sorted(labels.items())))
+
+def observe(name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels: str) -> None:
+    if _STATE.enabled:
+        REGISTRY.observe(name, value, tuple(sorted(labels.items())), buckets)
+
+def register_collector(name: str, fn: Callable[[], Dict[str, float]]) -> None:
+    REGISTRY.register_collector(name, fn)
+
+def snapshot() -> Dict[str, Any]:
+    return REGISTRY.snapshot()
+
+def render_prometheus() -> str:
+    return REGISTRY.render_prometheus()
+
+def timed(name: str, count: Optional[str] = None, **labels: str) -> Callable[[F], F]:
+    key: LabelKey = tuple(sorted(labels.items()))
+    errors = (name[:-len("_seconds")] if name.endswith("_seconds") else name) + "_errors_total"
+
+    def deco(fn: F) -> F:
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gen_wrapper(*args: Any, **kwargs: Any) -> Iterator[Any]:
+                if not _STATE.enabled:
+                    return (yield from fn(*args, **kwargs))
+                start = time.perf_counter()
+                rows = 0
+                gen = fn(*args, **kwargs)
+                try:
+                    for item in gen:
+                        rows += 1
+                        yield item
+                except Exception:
+                    REGISTRY.inc(errors, 1, key)
+                    raise
+                finally:
+                    gen.close()
+                    REGISTRY.observe(name, time.perf_counter() - start, key)
+                    if count:
+                        REGISTRY.inc(count, rows, key)
+            return gen_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _STATE.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                REGISTRY.inc(errors, 1, key)
+                raise
+            finally:
+                REGISTRY.observe(name, time.perf_counter() - start, key)
+            if count and isinstance(result, int) and not isinstance(result, bool):
+                REGISTRY.inc(count, result, key)
+            return result
+        return wrapper  # type: ignore[return-value]
+    return deco
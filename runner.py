@@ -1,11 +1,57 @@
 from __future__ import annotations
+import time
+
+_T0 = time.perf_counter()
+
 import tkinter as tk
-from gui import LogManagerApp
+import argparse
+import sys
+import os
+
+STARTUP_BUDGET_MS = float(os.getenv("TUNGLOGGER_STARTUP_BUDGET_MS", "1000"))
+
+def _startup_timing(budget_ms: float) -> int:
+    marks = {}
+
+    def mark(name: str) -> None:
+        marks[name] = (time.perf_counter() - _T0) * 1000
+
+    from gui import LogManagerApp
+    mark("imports")
+    root = tk.Tk()
+    result = {"ok": False}
+
+    def on_ready(ok: bool) -> None:
+        mark("first_page")
+        result["ok"] = ok
+        root.after(0, root.destroy)
+
+    app = LogManagerApp(root, on_ready=on_ready)
+    root.update()
+    mark("window")
+    root.after(30000, root.destroy)
+    root.mainloop()
+    app.tasks.shutdown()
+    app.manager.close(timeout=2.0)
+
+    for name in ("imports", "window", "first_page"):
+        print(f"{name:<12}{marks[name]:>10.1f} ms" if name in marks else f"{name:<12}{'-':>10}")
+    over = marks["window"] > budget_ms
+    print(f"window budget {budget_ms:.0f} ms: {'EXCEEDED' if over else 'ok'}{'' if result['ok'] else ' (first page failed)'}")
+    return 1 if over else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TungLogger desktop log manager")
+    parser.add_argument("--startup-time", action="store_true", help="measure startup, print the timings and exit")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS, help="window-visible budget for --startup-time")
+    args = parser.parse_args(argv)
+    if args.startup_time:
+        sys.exit(_startup_timing(args.budget_ms))
 
-def main():
+    from gui import LogManagerApp
     root = tk.Tk()
     app = LogManagerApp(root)
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
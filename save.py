@@ -1,63 +1,300 @@
 from __future__ import annotations
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
 from pathlib import Path
-from typing import List, Dict, Any
-from docx import Document
+from typing import Dict, Any, IO, Iterable, Iterator, List, Optional, Tuple
+from collections import Counter
+from xml.sax.saxutils import escape
+from metrics import timed
+import itertools
+import threading
+import zipfile
+import random
+import gzip
 import json
 import csv
+import io
+import re
+import os
+
+COMPRESSIONS = ("gzip", "zstd")
+REPORT_MODES = ("full", "summary")
+REPORT_SAMPLE_SIZE = int(os.getenv("REPORT_SAMPLE_SIZE", "1000"))
+REPORT_LARGE_THRESHOLD = int(os.getenv("REPORT_LARGE_THRESHOLD", "50000"))
+
+PDF_FONT = "Courier"
+PDF_FONT_SIZE = 7
+PDF_LEADING = 9
+PDF_MARGIN = 30
+_RL_CONFIG_LOCK = threading.Lock()
+DOCX_CHUNK_ROWS = 1000
+
+REPORT_COLUMNS = ("id", "log_type", "log_message", "hostname", "created_at")
+REPORT_HEADERS = ("ID", "Type", "Message", "Hostname", "Created At")
+
+_PDF_WHITESPACE = re.compile(r"[\x00-\x1f\x7f]")
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
 
 def _ensure_parent(path: Path) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
 
-def export_json(logs: List[Dict[str, Any]], filename: str) -> None:
-    path = Path(filename)
+def _detect_compression(path: Path, compression: Optional[str]) -> Optional[str]:
+    if compression is not None:
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unsupported compression '{compression}'. Allowed: {', '.join(COMPRESSIONS)}")
+        return compression
+    if path.suffix == ".gz":
+        return "gzip"
+    if path.suffix == ".zst":
+        return "zstd"
+    return None
+
+def _open_text(path: Path, compression: Optional[str] = None, newline: Optional[str] = None) -> IO[str]:
     _ensure_parent(path)
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(logs, f, ensure_ascii=False, indent=2, default=str)
+    kind = _detect_compression(path, compression)
+    if kind == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8", newline=newline)
+    if kind == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd compression requires the 'zstandard' package!") from None
+        raw = path.open("wb")
+        writer = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(writer, encoding="utf-8", newline=newline)
+    return path.open("w", encoding="utf-8", newline=newline)
+
+@timed("export_seconds", count="export_rows_total", format="json")
+def export_json(logs: Iterable[Dict[str, Any]], filename: str, compression: Optional[str] = None) -> int:
+    count = 0
+    with _open_text(Path(filename), compression) as f:
+        f.write("[")
+        for log in logs:
+            f.write(",\n  " if count else "\n  ")
+            f.write(json.dumps(log, ensure_ascii=False, indent=2, default=str).replace("\n", "\n  "))
+            count += 1
+        f.write("\n]" if count else "]")
+    return count
 
-def export_csv(logs: List[Dict[str, Any]], filename: str) -> None:
-    if not logs:
+@timed("export_seconds", count="export_rows_total", format="ndjson")
+def export_ndjson(logs: Iterable[Dict[str, Any]], filename: str, compression: Optional[str] = None) -> int:
+    count = 0
+    with _open_text(Path(filename), compression) as f:
+        for log in logs:
+            f.write(json.dumps(log, ensure_ascii=False, default=str))
+            f.write("\n")
+            count += 1
+    return count
+
+@timed("export_seconds", count="export_rows_total", format="csv")
+def export_csv(logs: Iterable[Dict[str, Any]], filename: str, compression: Optional[str] = None) -> int:
+    rows = iter(logs)
+    first = next(rows, None)
+    if first is None:
         raise ValueError("No logs to export!")
-    path = Path(filename)
-    _ensure_parent(path)
-    with path.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=list(logs[0].keys()))
+    count = 0
+    with _open_text(Path(filename), compression, newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(first.keys()))
         writer.writeheader()
-        writer.writerows(logs)
+        for log in itertools.chain([first], rows):
+            writer.writerow(log)
+            count += 1
+    return count
+
+def _check_mode(mode: str) -> None:
+    if mode not in REPORT_MODES:
+        raise ValueError(f"Unsupported report mode '{mode}'. Allowed: {', '.join(REPORT_MODES)}")
+
+def summarize(logs: Iterable[Dict[str, Any]], sample: int = REPORT_SAMPLE_SIZE, seed: Optional[int] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    rng = random.Random(seed)
+    types: Counter = Counter()
+    hosts: Counter = Counter()
+    first = last = None
+    picked: List[Tuple[int, Dict[str, Any]]] = []
+    total = 0
+    for total, log in enumerate(logs, 1):
+        types[log.get("log_type", "-")] += 1
+        hosts[log.get("hostname", "-")] += 1
+        created = log.get("created_at")
+        if created is not None:
+            if first is None or created < first:
+                first = created
+            if last is None or created > last:
+                last = created
+        if len(picked) < sample:
+            picked.append((total, log))
+        else:
+            j = rng.randrange(total)
+            if j < sample:
+                picked[j] = (total, log)
+    picked.sort(key=lambda p: p[0])
+    summary = {
+        "total": total,
+        "first": first,
+        "last": last,
+        "types": dict(types.most_common()),
+        "hosts": dict(hosts.most_common()),
+        "sampled": len(picked),
+    }
+    return summary, [log for _, log in picked]
+
+def _summary_lines(summary: Dict[str, Any], top_hosts: int = 20) -> List[str]:
+    total = summary["total"] or 1
+    lines = [
+        f"Total logs: {summary['total']}",
+        f"Time range: {summary['first'] or '-'} .. {summary['last'] or '-'}",
+        "By type: " + ", ".join(f"{t} {n} ({n * 100 / total:.1f}%)" for t, n in summary["types"].items()),
+        f"Hosts: {len(summary['hosts'])}",
+    ]
+    lines.extend(f"  {h}: {n}" for h, n in itertools.islice(summary["hosts"].items(), top_hosts))
+    lines.append(f"Sample: {summary['sampled']} of {summary['total']} logs, in export order.")
+    return lines
 
-def export_pdf(logs: List[Dict[str, Any]], filename: str) -> None:
+def _wrap(line: str, cols: int) -> List[str]:
+    out: List[str] = []
+    indent, width = "", cols
+    while len(line) > width:
+        cut = line.rfind(" ", 0, width + 1)
+        if cut <= 0:
+            cut = width
+        out.append(indent + line[:cut])
+        line = line[cut:].lstrip(" ")
+        indent, width = "    ", cols - 4
+    out.append(indent + line)
+    return out
+
+def _pdf_lines(logs: Iterable[Dict[str, Any]], cols: int) -> Iterator[str]:
+    for log in logs:
+        line = " | ".join(str(log.get(c, "-")) for c in REPORT_COLUMNS)
+        if not line.isprintable():
+            line = _PDF_WHITESPACE.sub(" ", line)
+        if len(line) <= cols:
+            yield line
+        else:
+            yield from _wrap(line, cols)
+
+def _pdf_escape(line: str) -> str:
+    line = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    if line.isascii():
+        return line
+    return "".join(chr(b) if b < 128 else f"\\{b:03o}" for b in line.encode("cp1252", "replace"))
+
+def _text_block(lines: List[str], x: float, y: float) -> str:
+    #font and leading come from the canvas' text state, which persists across BT/ET
+    return f"BT {x} {y} Td ({') Tj T* ('.join(map(_pdf_escape, lines))}) Tj ET"
+
+@timed("export_seconds", count="export_rows_total", format="pdf")
+def export_pdf(logs: Iterable[Dict[str, Any]], filename: str, mode: str = "full", sample: int = REPORT_SAMPLE_SIZE) -> int:
+    from reportlab.pdfgen import canvas
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.lib.pagesizes import A4
+    from reportlab import rl_config
+    from reportlab.pdfbase import pdfmetrics
+    _check_mode(mode)
     path = Path(filename)
     _ensure_parent(path)
-    cnvs = canvas.Canvas(str(path), pagesize=A4)
     width, height = A4
-    y = height - 40
-    for i, log in enumerate(logs, start=1):
-        line = f"{log.get('id','-')} | {log.get('log_type','-')} | {log.get('log_message','')} | {log.get('hostname','-')} | {log.get('created_at','-')}"
-        cnvs.drawString(30, y, line[:120])
-        y -= 18
-        if y < 40:
-            cnvs.showPage()
-            y = height - 40
-    cnvs.save()
-
-def export_docx(logs: List[Dict[str, Any]], filename: str) -> None:
+    cols = int((width - 2 * PDF_MARGIN) / stringWidth("M", PDF_FONT, PDF_FONT_SIZE))
+    per_page = int((height - 2 * PDF_MARGIN) / PDF_LEADING) - 2
+    header = " | ".join(REPORT_HEADERS)
+    count = 0
+
+    def _counted() -> Iterator[Dict[str, Any]]:
+        nonlocal count
+        for log in logs:
+            count += 1
+            yield log
+
+    lines: Iterator[str]
+    if mode == "summary":
+        summary, picked = summarize(_counted(), sample)
+        lines = itertools.chain(["Log Report (summary)", ""], _summary_lines(summary), [""], _pdf_lines(picked, cols))
+    else:
+        lines = _pdf_lines(_counted(), cols)
+
+    bold = f"{PDF_FONT}-Bold"
+    for name in (PDF_FONT, bold):
+        pdfmetrics.getFont(name) #registers the standard font, or fails early on an unknown PDF_FONT
+    cnvs = canvas.Canvas(str(path), pagesize=A4, pageCompression=1)
+    #Pages are written as raw text operators: reportlab's per-line textobject escaping dominates large exports
+    top = height - PDF_MARGIN
+    page = 0
+    while True:
+        chunk = list(itertools.islice(lines, per_page))
+        if not chunk and page:
+            break
+        page += 1
+        cnvs.setFont(bold, PDF_FONT_SIZE, PDF_LEADING)
+        cnvs.addLiteral(_text_block([header], PDF_MARGIN, top))
+        cnvs.setFont(PDF_FONT, PDF_FONT_SIZE, PDF_LEADING)
+        if chunk:
+            cnvs.addLiteral(_text_block(chunk, PDF_MARGIN, top - 2 * PDF_LEADING))
+        cnvs.drawRightString(width - PDF_MARGIN, PDF_MARGIN / 2, f"Page {page}")
+        cnvs.showPage()
+        if not chunk:
+            break
+    #useA85 is a process-wide reportlab setting read while the document is written, so exports take turns flipping it
+    with _RL_CONFIG_LOCK:
+        use_a85 = rl_config.useA85
+        rl_config.useA85 = 0 #Binary Flate streams; pure-Python ASCII85 encoding would otherwise dominate
+        try:
+            cnvs.save()
+        finally:
+            rl_config.useA85 = use_a85
+    return count
+
+def _xml_text(value: Any) -> str:
+    return escape(_XML_INVALID.sub("", "" if value is None else str(value)))
+
+def _split_row_template(xml: str) -> Tuple[str, List[str], str]:
+    marker = xml.index("@@0@@")
+    start = [m.start() for m in re.finditer(r"<w:tr[ >]", xml[:marker])][-1]
+    end = xml.index("</w:tr>", marker) + len("</w:tr>")
+    row = xml[start:end].replace("<w:t>@@", '<w:t xml:space="preserve">@@')
+    return xml[:start], re.split(r"@@\d@@", row), xml[end:]
+
+@timed("export_seconds", count="export_rows_total", format="docx")
+def export_docx(logs: Iterable[Dict[str, Any]], filename: str, mode: str = "full", sample: int = REPORT_SAMPLE_SIZE) -> int:
+    from docx import Document
+    _check_mode(mode)
     path = Path(filename)
     _ensure_parent(path)
     doc = Document()
     doc.add_heading("Log Export", level=1)
-    table = doc.add_table(rows=1, cols=5)
-    hdr = table.rows[0].cells
-    hdr[0].text = "ID"
-    hdr[1].text = "Type"
-    hdr[2].text = "Message"
-    hdr[3].text = "Hostname"
-    hdr[4].text = "Created At"
-    for log in logs:
-        row = table.add_row().cells
-        row[0].text = str(log.get("id", ""))
-        row[1].text = str(log.get("log_type", ""))
-        row[2].text = str(log.get("log_message", ""))
-        row[3].text = str(log.get("hostname", ""))
-        row[4].text = str(log.get("created_at", ""))
-    doc.save(str(path))
\ No newline at end of file
+    count: Optional[int] = None
+    if mode == "summary":
+        summary, logs = summarize(logs, sample)
+        count = summary["total"]
+        for line in _summary_lines(summary):
+            doc.add_paragraph(line)
+    table = doc.add_table(rows=2, cols=len(REPORT_HEADERS))
+    for i, title in enumerate(REPORT_HEADERS):
+        table.rows[0].cells[i].text = title
+        table.rows[1].cells[i].text = f"@@{i}@@"
+    skeleton = io.BytesIO()
+    doc.save(skeleton)
+
+    written = 0
+    with zipfile.ZipFile(skeleton) as src, zipfile.ZipFile(str(path), "w", zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            if item.filename != "word/document.xml":
+                dst.writestr(item, src.read(item.filename))
+                continue
+            prefix, pieces, suffix = _split_row_template(src.read(item.filename).decode("utf-8"))
+            info = zipfile.ZipInfo(item.filename, date_time=item.date_time)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with dst.open(info, "w") as out:
+                out.write(prefix.encode("utf-8"))
+                rows = iter(logs)
+                while True:
+                    chunk = list(itertools.islice(rows, DOCX_CHUNK_ROWS))
+                    if not chunk:
+                        break
+                    buf: List[str] = []
+                    for log in chunk:
+                        buf.append(pieces[0])
+                        for col, piece in zip(REPORT_COLUMNS, pieces[1:]):
+                            buf.append(_xml_text(log.get(col, "")))
+                            buf.append(piece)
+                    out.write("".join(buf).encode("utf-8"))
+                    written += len(chunk)
+                out.write(suffix.encode("utf-8"))
+    return count if count is not None else written
@@ -1,9 +1,66 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, ValidationError
+from typing import Any, AsyncIterator, List, Optional, Tuple
+from datetime import datetime, timezone
+import contextlib
+import asyncio
+import logging
+import base64
+import json
+import time
+import zlib
+import os
+from database import init_db, maintenance_tick, MAINTENANCE_TICK, PG_MAINTENANCE_INTERVAL, DB_UNAVAILABLE_ERRORS, search_logs, fetch_stats, LogQuery, SEARCH_MODES, ROLLUP_BUCKETS, ROLLUP_GROUPS, QUERY_ORDERS
+from async_database import async_insert_logs_bulk, async_query_logs, async_iter_logs, async_close_pool
+from batcher import AsyncBatchWriter, BATCH_SIZE, BATCH_QUEUE_SIZE
+from logger import VALID_LOG_TYPES
+from metrics import render_prometheus
 
-app = FastAPI(title="Log Server API Section", version="0.1")
+log = logging.getLogger("ServerAPI")
+
+if not log.handlers:
+    log.setLevel(logging.INFO)
+    _ch = logging.StreamHandler()
+    _ch.setFormatter(logging.Formatter("[%(levelname)s] ServerAPI: %(message)s"))
+    log.addHandler(_ch)
+
+API_MAINTENANCE = os.getenv("API_MAINTENANCE", "1") == "1" #set to 0 when maintenance runs elsewhere
+API_BATCH_INTERVAL = float(os.getenv("API_BATCH_INTERVAL", "0.05"))
+API_PAGE_LIMIT = int(os.getenv("API_PAGE_LIMIT", "1000"))
+API_STREAM_CHUNK = int(os.getenv("API_STREAM_CHUNK", "5000"))
+API_STREAM_MAX_ERRORS = 20
+API_STREAM_MAX_LINE = int(os.getenv("API_STREAM_MAX_LINE", str(1 << 20))) #bytes; longer lines get a 413
+
+_WRITER = AsyncBatchWriter(async_insert_logs_bulk, BATCH_SIZE, API_BATCH_INTERVAL, BATCH_QUEUE_SIZE)
+
+async def _maintenance_loop() -> None:
+    due = time.monotonic() + PG_MAINTENANCE_INTERVAL
+    while True:
+        await asyncio.sleep(MAINTENANCE_TICK)
+        try:
+            due = await run_in_threadpool(maintenance_tick, due)
+        except DB_UNAVAILABLE_ERRORS as e:
+            log.warning("Maintenance skipped, DB unavailable: %s", e)
+        except Exception as e:
+            log.error("Maintenance failed: %s", e)
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    await run_in_threadpool(init_db)
+    _WRITER.start()
+    maintenance = asyncio.create_task(_maintenance_loop()) if API_MAINTENANCE else None
+    yield
+    if maintenance is not None:
+        maintenance.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await maintenance
+    await _WRITER.close()
+    await async_close_pool()
+
+app = FastAPI(title="Log Server API Section", version="0.2", lifespan=_lifespan)
 
 @app.get("/")
 def root():
@@ -15,40 +72,246 @@ class APILog(BaseModel):
     hostname: Optional[str] = None
     created_at: Optional[datetime] = None
 
+class APILogOut(APILog):
+    id: int
+
 LogItem = APILog
 
-_STORE: List[dict] = [
-    {
-        "log_type": "INFO",
-        "log_message": "API server started",
-        "hostname": "local-api",
-        "created_at": datetime.utcnow()
-    }
-]
+def _encode_cursor(row: dict) -> str:
+    raw = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, log_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at), int(log_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor!")
+
+def _parse_types(type: Optional[List[str]]) -> Optional[List[str]]:
+    types = [t.upper() for t in type] if type else None
+    if types and any(t not in VALID_LOG_TYPES for t in types):
+        raise HTTPException(status_code=400, detail=f"type must be one of: {', '.join(VALID_LOG_TYPES)}")
+    return types
+
+async def _fetch_page(
+    type: Optional[List[str]],
+    host: Optional[List[str]],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    cursor: Optional[str],
+    limit: int,
+    contains: Optional[str] = None,
+    regex: Optional[str] = None,
+    order: str = "desc",
+) -> Tuple[List[dict], Optional[str]]:
+    types = _parse_types(type)
+    if order not in QUERY_ORDERS:
+        raise HTTPException(status_code=400, detail=f"order must be one of: {', '.join(QUERY_ORDERS)}")
+    q = LogQuery(types, host, since, until, contains=contains, regex=regex, order=order, limit=limit)
+    if cursor:
+        q.cursor = _decode_cursor(cursor)
+    try:
+        rows = await async_query_logs(q)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    next_cursor = _encode_cursor(rows[-1]) if len(rows) >= limit else None
+    return rows, next_cursor
 
 @app.get("/api/health")
 def health():
     return {"status": "ok", "time": datetime.utcnow()}
 
-@app.get("/api/logs", response_model=List[LogItem])
-def get_logs():
-    return _STORE
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/logs", response_model=List[APILogOut])
+async def get_logs(
+    response: Response,
+    type: Optional[List[str]] = Query(None),
+    host: Optional[List[str]] = Query(None),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=API_PAGE_LIMIT),
+    contains: Optional[str] = None,
+    regex: Optional[str] = None,
+    order: str = "desc",
+):
+    rows, next_cursor = await _fetch_page(type, host, since, until, cursor, limit, contains, regex, order)
+    response.headers["X-Order"] = order
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
 
 @app.get("/api/logs_wrapped")
-def get_logs_wrapped():
-    return {"data": _STORE}
+async def get_logs_wrapped(
+    type: Optional[List[str]] = Query(None),
+    host: Optional[List[str]] = Query(None),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=API_PAGE_LIMIT),
+    contains: Optional[str] = None,
+    regex: Optional[str] = None,
+    order: str = "desc",
+):
+    rows, next_cursor = await _fetch_page(type, host, since, until, cursor, limit, contains, regex, order)
+    return {"data": rows, "next_cursor": next_cursor, "order": order}
+
+@app.get("/api/logs/search")
+def get_logs_search(
+    q: str,
+    type: Optional[List[str]] = Query(None),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    mode: str = "text",
+):
+    types = _parse_types(type)
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(SEARCH_MODES)}")
+    try:
+        return search_logs(q, types, since, until, limit, mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/stats")
+def get_stats(
+    bucket: str = "hour",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    type: Optional[List[str]] = Query(None),
+    host: Optional[List[str]] = Query(None),
+    group_by: List[str] = Query(list(ROLLUP_GROUPS)),
+):
+    if bucket not in ROLLUP_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of: {', '.join(ROLLUP_BUCKETS)}")
+    types = _parse_types(type)
+    try:
+        return fetch_stats(bucket, since, until, types, host, [g for g in group_by if g != "none"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _to_row(item: APILog, default_host: str) -> Tuple[str, str, str, Any]:
+    log_type = item.log_type.upper()
+    if log_type not in VALID_LOG_TYPES:
+        raise HTTPException(status_code=422, detail=f"Invalid log_type '{item.log_type}'. Allowed: {', '.join(VALID_LOG_TYPES)}")
+    created_at = item.created_at or datetime.now(timezone.utc)
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return (log_type, item.log_message, item.hostname or default_host, created_at)
 
 @app.post("/api/logs")
-def post_logs(items: List[APILog]):
-    level = 0
-    for item in items:
-        d = item.dict()
-        if d.get("created_at") is None:
-            d["created_at"] = datetime.utcnow()
-        _STORE.append(d)
-        level += 1
+async def post_logs(items: List[APILog], request: Request):
+    default_host = request.client.host if request.client else "api"
+    rows = [_to_row(item, default_host) for item in items]
+    level = await _WRITER.submit_many(rows)
     return {"inserted": level}
 
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+@app.post("/api/logs/stream")
+async def post_logs_stream(request: Request):
+    default_host = request.client.host if request.client else "api"
+    encoding = request.headers.get("content-encoding", "").lower()
+    if encoding not in ("", "identity", "gzip"):
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding '{encoding}'!")
+    decomp = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding == "gzip" else None
+
+    inserted = 0
+    rejected = 0
+    errors: List[str] = []
+    rows: List[Tuple[str, str, str, Any]] = []
+    line_no = 0
+    buf = b""
+
+    async def _parse(line: bytes) -> None:
+        nonlocal inserted, rejected, rows, line_no
+        line_no += 1
+        if not line.strip():
+            return
+        try:
+            rows.append(_to_row(APILog.model_validate_json(line), default_host))
+        except ValidationError as e:
+            rejected += 1
+            if len(errors) < API_STREAM_MAX_ERRORS:
+                errors.append(f"line {line_no}: {e.errors()[0]['msg']}")
+            return
+        except HTTPException as e:
+            rejected += 1
+            if len(errors) < API_STREAM_MAX_ERRORS:
+                errors.append(f"line {line_no}: {e.detail}")
+            return
+        if len(rows) >= API_STREAM_CHUNK:
+            inserted += await async_insert_logs_bulk(rows)
+            rows = []
+
+    async def _fail(status: int, msg: str) -> None:
+        #chunks are committed as they arrive, so say exactly how far the body got; a retry resumes after committed_lines
+        nonlocal inserted, rows
+        if rows:
+            inserted += await async_insert_logs_bulk(rows)
+            rows = []
+        raise HTTPException(status_code=status, detail={
+            "error": msg, "inserted": inserted, "rejected": rejected, "committed_lines": line_no, "errors": errors,
+        })
+
+    async def _feed(data: bytes) -> None:
+        nonlocal buf
+        buf += data
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            await _parse(line)
+        if len(buf) > API_STREAM_MAX_LINE:
+            await _fail(413, f"Line {line_no + 1} is longer than {API_STREAM_MAX_LINE} bytes!")
+
+    try:
+        async for chunk in request.stream():
+            if decomp is None:
+                await _feed(chunk)
+                continue
+            data = decomp.decompress(chunk, API_STREAM_MAX_LINE)
+            await _feed(data)
+            while decomp.unconsumed_tail:
+                await _feed(decomp.decompress(decomp.unconsumed_tail, API_STREAM_MAX_LINE))
+        if decomp is not None:
+            await _feed(decomp.flush())
+            if not decomp.eof:
+                await _fail(400, "Invalid gzip body: stream is truncated")
+    except zlib.error as e:
+        await _fail(400, f"Invalid gzip body: {e}")
+    await _parse(buf)
+    if rows:
+        inserted += await async_insert_logs_bulk(rows)
+    return {"inserted": inserted, "rejected": rejected, "errors": errors}
+
+@app.get("/api/logs/stream")
+async def get_logs_stream(
+    type: Optional[List[str]] = Query(None),
+    host: Optional[List[str]] = Query(None),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1),
+):
+    types = _parse_types(type)
+
+    async def _lines() -> AsyncIterator[bytes]:
+        batch: List[str] = []
+        async for row in async_iter_logs(types, since, until, host, limit):
+            batch.append(json.dumps(row, ensure_ascii=False, default=_json_default))
+            if len(batch) >= 500:
+                yield ("\n".join(batch) + "\n").encode("utf-8")
+                batch = []
+        if batch:
+            yield ("\n".join(batch) + "\n").encode("utf-8")
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("api_server:app", host="127.0.0.1", port=8000, reload=True) #default local
\ No newline at end of file
+    uvicorn.run("server_api:app", host="127.0.0.1", port=8000, reload=True) #default local
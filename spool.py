@@ -0,0 +1,214 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from datetime import datetime
+from pathlib import Path
+from database import init_db, insert_logs_replay, DB_UNAVAILABLE_ERRORS
+import threading
+import logging
+import sqlite3
+import time
+import uuid
+import os
+
+log = logging.getLogger("Spool")
+
+if not log.handlers:
+    log.setLevel(logging.INFO)
+    _ch = logging.StreamHandler()
+    _ch.setFormatter(logging.Formatter("[%(levelname)s] Spool: %(message)s"))
+    log.addHandler(_ch)
+
+SPOOL_ENABLED = os.getenv("LOG_SPOOL", "0") == "1"
+SPOOL_PATH = os.getenv("LOG_SPOOL_PATH", str(Path.home() / ".tunglogger" / "spool.db"))
+SPOOL_SYNC = os.getenv("LOG_SPOOL_SYNC", "NORMAL").upper() #NORMAL fsyncs on WAL checkpoints, FULL on every commit
+SPOOL_REPLAY_BATCH = int(os.getenv("LOG_SPOOL_REPLAY_BATCH", "5000"))
+SPOOL_REPLAY_INTERVAL = float(os.getenv("LOG_SPOOL_REPLAY_INTERVAL", "2"))
+SPOOL_BACKOFF_MAX = float(os.getenv("LOG_SPOOL_BACKOFF_MAX", "60"))
+
+Row = Tuple[str, str, str, Any]
+
+class CircuitBreaker:
+    def __init__(self, base_delay: float = 1.0, max_delay: float = SPOOL_BACKOFF_MAX) -> None:
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._retry_at = 0.0
+
+    @property
+    def open(self) -> bool:
+        return self._failures > 0 and time.monotonic() < self._retry_at
+
+    def failed(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._retry_at = time.monotonic() + min(self.max_delay, self.base_delay * 2 ** (self._failures - 1))
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._retry_at = 0.0
+
+class Spool:
+    def __init__(
+        self,
+        path: str = SPOOL_PATH,
+        replay_batch: int = SPOOL_REPLAY_BATCH,
+        replay_interval: float = SPOOL_REPLAY_INTERVAL,
+    ) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.replay_batch = max(1, replay_batch)
+        self.replay_interval = max(0.05, replay_interval)
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL;")
+        self._db.execute(f"PRAGMA synchronous={'FULL' if SPOOL_SYNC == 'FULL' else 'NORMAL'};")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS spool (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                ingest_key TEXT NOT NULL,
+                log_type TEXT NOT NULL,
+                log_message TEXT NOT NULL,
+                hostname TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            );
+        """)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS spool_quarantine (
+                seq INTEGER PRIMARY KEY,
+                ingest_key TEXT NOT NULL,
+                log_type TEXT NOT NULL,
+                log_message TEXT NOT NULL,
+                hostname TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                error TEXT NOT NULL
+            );
+        """)
+        self._counts = {"spooled": 0, "replayed": 0, "duplicates": 0, "quarantined": 0, "replay_failures": 0}
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._replay_loop, name="log-spool-replay", daemon=True)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread.ident is None:
+                self._thread.start()
+
+    @staticmethod
+    def new_keys(count: int) -> List[str]:
+        return [uuid.uuid4().hex for _ in range(count)]
+
+    def append(self, rows: Sequence[Row], keys: Optional[Sequence[str]] = None) -> int:
+        if not rows:
+            return 0
+        keys = keys if keys is not None else self.new_keys(len(rows))
+        data = [(k, t, m, h, c.isoformat() if hasattr(c, "isoformat") else str(c)) for k, (t, m, h, c) in zip(keys, rows)]
+        with self._lock:
+            self._db.execute("BEGIN;")
+            try:
+                self._db.executemany(
+                    "INSERT INTO spool (ingest_key, log_type, log_message, hostname, created_at) VALUES (?, ?, ?, ?, ?);",
+                    data,
+                )
+                self._db.execute("COMMIT;")
+            except Exception:
+                self._db.execute("ROLLBACK;")
+                raise
+            self._counts["spooled"] += len(data)
+        return len(data)
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM spool;").fetchone()[0]
+
+    def quarantined(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM spool_quarantine;").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counts)
+        stats["pending"] = self.pending()
+        stats["quarantine"] = self.quarantined()
+        stats["breaker_open"] = self.breaker.open
+        return stats
+
+    def replay_once(self) -> int:
+        with self._lock:
+            batch = self._db.execute(
+                "SELECT seq, ingest_key, log_type, log_message, hostname, created_at FROM spool ORDER BY seq LIMIT ?;",
+                (self.replay_batch,),
+            ).fetchall()
+        if not batch:
+            return 0
+        rows, bad = [], []
+        for seq, k, t, m, h, c in batch:
+            try:
+                rows.append((k, t, m, h, datetime.fromisoformat(c)))
+            except ValueError as e:
+                bad.append((seq, k, t, m, h, c, str(e)))
+        if rows:
+            init_db()
+        inserted = insert_logs_replay(rows)
+        with self._lock:
+            self._db.execute("BEGIN;")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO spool_quarantine VALUES (?, ?, ?, ?, ?, ?, ?);", bad)
+                self._db.execute("DELETE FROM spool WHERE seq <= ?;", (batch[-1][0],))
+                self._db.execute("COMMIT;")
+            except Exception:
+                self._db.execute("ROLLBACK;")
+                raise
+            self._counts["replayed"] += inserted
+            self._counts["duplicates"] += len(rows) - inserted
+            self._counts["quarantined"] += len(bad)
+        if bad:
+            log.error("Quarantined %d spooled logs with an unreadable created_at.", len(bad))
+        log.info("Replayed %d spooled logs (%d duplicates skipped).", inserted, len(rows) - inserted)
+        return len(batch)
+
+    def _replay_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.replay_interval)
+            self._wake.clear()
+            if self.breaker.open:
+                continue
+            try:
+                replayed = self.replay_once()
+                while replayed and not self._stop.is_set():
+                    self.breaker.succeeded()
+                    if replayed < self.replay_batch:
+                        break
+                    replayed = self.replay_once()
+            except DB_UNAVAILABLE_ERRORS as e:
+                self.breaker.failed()
+                with self._lock:
+                    self._counts["replay_failures"] += 1
+                log.warning("Replay failed, DB still unavailable: %s", e)
+            except Exception as e:
+                with self._lock:
+                    self._counts["replay_failures"] += 1
+                log.error("Replay failed: %s", e)
+
+    def replay_now(self) -> None:
+        self._wake.set()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread.ident is not None:
+            self._thread.join(timeout=timeout)
+        with self._lock:
+            self._db.close()
+
+_DEFAULT_SPOOL: Optional[Spool] = None
+_DEFAULT_LOCK = threading.Lock()
+
+def default_spool() -> Spool:
+    global _DEFAULT_SPOOL
+    with _DEFAULT_LOCK:
+        if _DEFAULT_SPOOL is None:
+            _DEFAULT_SPOOL = Spool()
+        return _DEFAULT_SPOOL
@@ -0,0 +1,265 @@
+from __future__ import annotations
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+from dataclasses import dataclass
+from collections import deque
+import threading
+import heapq
+import os
+
+LOG_STORE_CAPACITY = int(os.getenv("LOG_STORE_CAPACITY", "200000"))
+
+@dataclass(slots=True)
+class LogRecord:
+    id: Optional[int]
+    log_type: str
+    log_message: str
+    hostname: str
+    created_at: Any
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "log_type": self.log_type,
+            "log_message": self.log_message,
+            "hostname": self.hostname,
+            "created_at": self.created_at,
+        }
+
+class LogStore:
+    def __init__(self, capacity: int = LOG_STORE_CAPACITY) -> None:
+        self.capacity = max(1, capacity)
+        self._lock = threading.RLock()
+        self._ids: List[Optional[int]] = [None] * self.capacity
+        self._types: List[Optional[str]] = [None] * self.capacity
+        self._messages: List[Optional[str]] = [None] * self.capacity
+        self._hosts: List[Optional[str]] = [None] * self.capacity
+        self._created: List[Any] = [None] * self.capacity
+        self._by_type: Dict[str, Deque[int]] = {}
+        self._by_host: Dict[str, Deque[int]] = {}
+        self._lo = 0
+        self._hi = 0
+        self._max_id = 0
+        self._sorted = True #created_at never decreases with seq, so time bounds can be bisected
+
+    def __len__(self) -> int:
+        return self._hi - self._lo
+
+    def __bool__(self) -> bool:
+        return self._hi > self._lo
+
+    def __iter__(self) -> Iterator[LogRecord]:
+        with self._lock:
+            seqs = range(self._hi - 1, self._lo - 1, -1)
+            return iter([self._record(s) for s in seqs])
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        with self._lock:
+            size = self._hi - self._lo
+            if isinstance(index, slice):
+                return [self._record(self._hi - 1 - i) for i in range(*index.indices(size))]
+            if index < 0:
+                index += size
+            if not 0 <= index < size:
+                raise IndexError("LogStore index out of range")
+            return self._record(self._hi - 1 - index)
+
+    def _record(self, seq: int) -> LogRecord:
+        slot = seq % self.capacity
+        return LogRecord(self._ids[slot], self._types[slot], self._messages[slot], self._hosts[slot], self._created[slot])
+
+    def _row(self, seq: int) -> Dict[str, Any]:
+        slot = seq % self.capacity
+        return {
+            "id": self._ids[slot],
+            "log_type": self._types[slot],
+            "log_message": self._messages[slot],
+            "hostname": self._hosts[slot],
+            "created_at": self._created[slot],
+        }
+
+    def _write(self, seq: int, rec: LogRecord) -> None:
+        slot = seq % self.capacity
+        self._ids[slot] = rec.id
+        self._types[slot] = rec.log_type
+        self._messages[slot] = rec.log_message
+        self._hosts[slot] = rec.hostname
+        self._created[slot] = rec.created_at
+        if rec.id is not None and rec.id > self._max_id:
+            self._max_id = rec.id
+
+    def _check_order(self, older: int, newer: int) -> None:
+        if not self._sorted or not (self._lo <= older and newer < self._hi):
+            return
+        a, b = self._created[older % self.capacity], self._created[newer % self.capacity]
+        try:
+            self._sorted = a is not None and b is not None and a <= b
+        except TypeError:
+            self._sorted = False
+
+    def _evict_oldest(self) -> None:
+        seq = self._lo
+        slot = seq % self.capacity
+        for index, key in ((self._by_type, self._types[slot]), (self._by_host, self._hosts[slot])):
+            seqs = index.get(key)
+            if seqs:
+                seqs.popleft()
+                if not seqs:
+                    del index[key]
+        self._ids[slot] = self._types[slot] = self._messages[slot] = self._hosts[slot] = self._created[slot] = None
+        self._lo += 1
+
+    def appendleft(self, rec: LogRecord) -> int:
+        with self._lock:
+            if self._hi - self._lo >= self.capacity:
+                self._evict_oldest()
+            seq = self._hi
+            self._write(seq, rec)
+            self._by_type.setdefault(rec.log_type, deque()).append(seq)
+            self._by_host.setdefault(rec.hostname, deque()).append(seq)
+            self._hi += 1
+            self._check_order(seq - 1, seq)
+            return seq
+
+    def extendleft(self, records: Iterable[LogRecord]) -> None:
+        with self._lock:
+            for rec in records:
+                self.appendleft(rec)
+
+    def append(self, rec: LogRecord) -> bool:
+        with self._lock:
+            if self._hi - self._lo >= self.capacity:
+                return False
+            self._lo -= 1
+            self._write(self._lo, rec)
+            self._by_type.setdefault(rec.log_type, deque()).appendleft(self._lo)
+            self._by_host.setdefault(rec.hostname, deque()).appendleft(self._lo)
+            self._check_order(self._lo, self._lo + 1)
+            return True
+
+    def extend(self, records: Iterable[LogRecord]) -> int:
+        added = 0
+        with self._lock:
+            for rec in records:
+                if not self.append(rec):
+                    break
+                added += 1
+        return added
+
+    def replace(self, records: Iterable[LogRecord]) -> int:
+        with self._lock:
+            self.clear()
+            return self.extend(records)
+
+    def clear(self) -> None:
+        with self._lock:
+            for seq in range(self._lo, self._hi):
+                slot = seq % self.capacity
+                self._ids[slot] = self._types[slot] = self._messages[slot] = self._hosts[slot] = self._created[slot] = None
+            self._by_type.clear()
+            self._by_host.clear()
+            #older pages fill downwards from here, so no seq handed out before the clear is ever reused
+            self._lo = self._hi = self._hi + self.capacity
+            self._max_id = 0
+            self._sorted = True
+
+    def update(self, seq: int, log_id: Optional[int], created_at: Any) -> bool:
+        with self._lock:
+            if not self._lo <= seq < self._hi:
+                return False
+            slot = seq % self.capacity
+            self._ids[slot] = log_id
+            self._created[slot] = created_at
+            if log_id is not None and log_id > self._max_id:
+                self._max_id = log_id
+            self._check_order(seq - 1, seq)
+            self._check_order(seq, seq + 1)
+            return True
+
+    def max_id(self) -> int:
+        return self._max_id
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {
+                "types": {k: len(v) for k, v in self._by_type.items()},
+                "hosts": {k: len(v) for k, v in self._by_host.items()},
+            }
+
+    def _time_bounds(self, since: Any, until: Any) -> range:
+        lo, hi = self._lo, self._hi
+        if since is not None:
+            a, b = lo, hi
+            while a < b:
+                mid = (a + b) // 2
+                if self._created[mid % self.capacity] < since:
+                    a = mid + 1
+                else:
+                    b = mid
+            lo = a
+        if until is not None:
+            a, b = lo, hi
+            while a < b:
+                mid = (a + b) // 2
+                if self._created[mid % self.capacity] < until:
+                    a = mid + 1
+                else:
+                    b = mid
+            hi = a
+        return range(lo, hi)
+
+    def _matching(
+        self,
+        types: Optional[Sequence[str]],
+        hosts: Optional[Sequence[str]],
+        since: Any,
+        until: Any,
+    ) -> Iterator[int]:
+        timed = since is not None or until is not None
+        bounds = self._time_bounds(since, until) if timed and self._sorted else None
+        check_time = timed and bounds is None
+        type_seqs = [self._by_type[t] for t in set(types) if t in self._by_type] if types else None
+        host_seqs = [self._by_host[h] for h in set(hosts) if h in self._by_host] if hosts else None
+        check_type: Optional[set] = None
+        check_host: Optional[set] = None
+        if type_seqs is None and host_seqs is None:
+            seqs: Iterable[int] = reversed(bounds if bounds is not None else range(self._lo, self._hi))
+        else:
+            if host_seqs is None or (type_seqs is not None and sum(map(len, type_seqs)) <= sum(map(len, host_seqs))):
+                candidates = type_seqs or []
+                check_host = set(hosts) if hosts else None
+            else:
+                candidates = host_seqs
+                check_type = set(types) if types else None
+            seqs = heapq.merge(*(reversed(c) for c in candidates), reverse=True)
+        for seq in seqs:
+            if bounds is not None:
+                if seq >= bounds.stop:
+                    continue
+                if seq < bounds.start:
+                    break
+            slot = seq % self.capacity
+            if check_host is not None and self._hosts[slot] not in check_host:
+                continue
+            if check_type is not None and self._types[slot] not in check_type:
+                continue
+            if check_time:
+                created = self._created[slot]
+                if since is not None and created < since or until is not None and created >= until:
+                    continue
+            yield seq
+
+    def filter(
+        self,
+        types: Optional[Sequence[str]] = None,
+        hosts: Optional[Sequence[str]] = None,
+        since: Any = None,
+        until: Any = None,
+    ) -> List[LogRecord]:
+        with self._lock:
+            return [self._record(seq) for seq in self._matching(types, hosts, since, until)]
+
+    def to_dicts(self, types: Optional[Sequence[str]] = None, hosts: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            if types or hosts:
+                return [self._row(seq) for seq in self._matching(types, hosts, None, None)]
+            return [self._row(seq) for seq in range(self._hi - 1, self._lo - 1, -1)]
@@ -0,0 +1,135 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+from concurrent.futures import ThreadPoolExecutor
+import tkinter as tk
+import threading
+import logging
+import queue
+import time
+
+log = logging.getLogger("Tasks")
+
+if not log.handlers:
+    log.setLevel(logging.INFO)
+    _ch = logging.StreamHandler()
+    _ch.setFormatter(logging.Formatter("[%(levelname)s] Tasks: %(message)s"))
+    log.addHandler(_ch)
+
+ProgressFn = Callable[[int, Optional[int], str], None]
+
+class TaskCancelled(BaseException): #like asyncio.CancelledError, so broad "except Exception" handlers don't swallow it
+    pass
+
+class TaskHandle:
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, runner: "TaskRunner", name: str, on_progress: Optional[ProgressFn]) -> None:
+        self.name = name
+        self._runner = runner
+        self._on_progress = on_progress
+        self._cancelled = threading.Event()
+        self._last_progress = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def check(self) -> None:
+        if self._cancelled.is_set():
+            raise TaskCancelled(f"{self.name} cancelled")
+
+    def progress(self, done: int, total: Optional[int] = None, text: str = "", force: bool = False) -> None:
+        if self._on_progress is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_progress < self.PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        self._runner.post(self._on_progress, done, total, text)
+
+    def track(self, rows: Iterable[Any], total: Optional[int] = None, text: str = "", every: int = 500) -> Iterator[Any]:
+        count = 0
+        for row in rows:
+            count += 1
+            if count % every == 0:
+                self.check()
+                self.progress(count, total, text)
+            yield row
+        self.progress(count, total, text, force=True)
+
+class TaskRunner:
+    def __init__(self, root: tk.Misc, max_workers: int = 2, poll_ms: int = 50) -> None:
+        self.root = root
+        self.poll_ms = poll_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gui-task")
+        self._ui_queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._active: Dict[str, TaskHandle] = {}
+        self._closed = False
+        self.root.after(self.poll_ms, self._drain)
+
+    def busy(self, name: Optional[str] = None) -> bool:
+        return bool(self._active) if name is None else name in self._active
+
+    def submit(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        *args: Any,
+        on_done: Optional[Callable[[Any], None]] = None,
+        on_error: Optional[Callable[[BaseException], None]] = None,
+        on_cancel: Optional[Callable[[], None]] = None,
+        on_progress: Optional[ProgressFn] = None,
+        **kwargs: Any,
+    ) -> Optional[TaskHandle]:
+        if self._closed or name in self._active:
+            return None
+        handle = TaskHandle(self, name, on_progress)
+        self._active[name] = handle
+
+        def _run() -> None:
+            try:
+                result = fn(handle, *args, **kwargs)
+            except TaskCancelled:
+                self.post(self._finish, name, on_cancel)
+            except Exception as e:
+                log.error("Task '%s' failed: %s", name, e)
+                self.post(self._finish, name, on_error, e)
+            else:
+                self.post(self._finish, name, on_done, result)
+
+        self._executor.submit(_run)
+        return handle
+
+    def cancel(self, name: Optional[str] = None) -> None:
+        for task_name, handle in list(self._active.items()):
+            if name is None or task_name == name:
+                handle.cancel()
+
+    def post(self, callback: Callable[..., Any], *args: Any) -> None:
+        self._ui_queue.put((callback, args))
+
+    def shutdown(self) -> None:
+        self._closed = True
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _finish(self, name: str, callback: Optional[Callable[..., Any]], *args: Any) -> None:
+        self._active.pop(name, None)
+        if callback is not None:
+            callback(*args)
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                callback, args = self._ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception as e:
+                log.error("UI callback failed: %s", e)
+        if not self._closed:
+            self.root.after(self.poll_ms, self._drain)
@@ -0,0 +1,101 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import threading
+import os
+
+TEMPLATES_ENABLED = os.getenv("LOG_TEMPLATES", "0") == "1"
+TEMPLATE_SIM_THRESHOLD = float(os.getenv("LOG_TEMPLATE_SIM", "0.5"))
+TEMPLATE_MAX_CHILDREN = int(os.getenv("LOG_TEMPLATE_MAX_CHILDREN", "100"))
+TEMPLATE_MAX_TOKENS = int(os.getenv("LOG_TEMPLATE_MAX_TOKENS", "200"))
+
+WILDCARD = "<*>"
+
+Row = Tuple[str, str, str, Any]
+TemplatedRow = Tuple[str, Optional[str], str, Any, Optional[int], Optional[List[str]]]
+Extracted = Optional[Tuple[str, List[str]]]
+
+TEMPLATE_LOOKUP_SQL = """
+    WITH ins AS (
+        INSERT INTO log_templates (template)
+        SELECT unnest(%s::text[])
+        ON CONFLICT (template) DO NOTHING
+        RETURNING id, template
+    )
+    SELECT id, template FROM ins
+    UNION ALL
+    SELECT id, template FROM log_templates WHERE template = ANY(%s::text[])
+"""
+
+def _is_variable(token: str) -> bool:
+    return any(c.isdigit() for c in token)
+
+class TemplateMiner:
+    def __init__(
+        self,
+        sim_threshold: float = TEMPLATE_SIM_THRESHOLD,
+        max_children: int = TEMPLATE_MAX_CHILDREN,
+        max_tokens: int = TEMPLATE_MAX_TOKENS,
+    ) -> None:
+        self.sim_threshold = sim_threshold
+        self.max_children = max(1, max_children)
+        self.max_tokens = max(1, max_tokens)
+        self._lock = threading.Lock()
+        self._tree: Dict[Tuple[int, str], List[List[str]]] = {}
+        self._ids: Dict[str, int] = {}
+
+    def extract(self, message: str) -> Extracted:
+        if WILDCARD in message:
+            return None
+        tokens = message.split(" ")
+        if len(tokens) > self.max_tokens:
+            return None
+        masked = [WILDCARD if _is_variable(t) else t for t in tokens]
+        key = (len(masked), masked[0])
+        with self._lock:
+            leaf = self._tree.setdefault(key, [])
+            best, best_sim = None, -1.0
+            for i, cluster in enumerate(leaf):
+                same = sum(1 for a, b in zip(cluster, masked) if a == b and a != WILDCARD)
+                sim = same / len(masked)
+                if sim > best_sim:
+                    best, best_sim = i, sim
+            if best is not None and best_sim >= self.sim_threshold:
+                template = [a if a == b else WILDCARD for a, b in zip(leaf[best], masked)]
+                leaf[best] = template
+            else:
+                template = masked
+                if len(leaf) < self.max_children:
+                    leaf.append(template)
+        if all(t == WILDCARD for t in template):
+            return None
+        params = [tok for tok, tt in zip(tokens, template) if tt == WILDCARD]
+        return " ".join(template), params
+
+    def extract_rows(self, rows: Iterable[Row]) -> List[Extracted]:
+        return [self.extract(m) for _, m, _, _ in rows]
+
+    def missing(self, extracted: Iterable[Extracted]) -> List[str]:
+        return list({e[0] for e in extracted if e is not None and e[0] not in self._ids})
+
+    def remember(self, mapping: Iterable[Tuple[int, str]]) -> None:
+        for template_id, template in mapping:
+            self._ids[template] = template_id
+
+    def encode(self, rows: Sequence[Row], extracted: Sequence[Extracted]) -> List[TemplatedRow]:
+        out: List[TemplatedRow] = []
+        for (t, m, h, c), e in zip(rows, extracted):
+            template_id = self._ids.get(e[0]) if e is not None else None
+            if template_id is None:
+                out.append((t, m, h, c, None, None))
+            else:
+                out.append((t, None, h, c, template_id, e[1]))
+        return out
+
+    @staticmethod
+    def render(template: str, params: Sequence[str]) -> str:
+        it = iter(params)
+        return " ".join(next(it) if t == WILDCARD else t for t in template.split(" "))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"clusters": sum(len(v) for v in self._tree.values()), "known_ids": len(self._ids)}
@@ -0,0 +1,126 @@
+from __future__ import annotations
+import tkinter as tk
+from tkinter import ttk
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from datetime import timezone
+
+class VirtualLogView(ttk.Frame):
+    COLUMNS = ("id", "type", "message", "host", "created")
+    HEADINGS = (("ID", 60, "center"), ("Type", 90, "center"), ("Message", 450, "w"), ("Hostname", 160, "w"), ("Created At", 180, "w"))
+    HEADER_HEIGHT = 28
+    PREFETCH_PAGES = 2
+
+    def __init__(self, master: tk.Misc, on_need_more: Optional[Callable[[], None]] = None, **kwargs: Any) -> None:
+        super().__init__(master, **kwargs)
+        self.on_need_more = on_need_more
+        self._source: Sequence[Any] = []
+        self._offset = 0
+        self._visible = 1
+        self._items: List[str] = []
+        self._rendered: List[Tuple[Any, ...]] = []
+        self._loading = False
+
+        self.tree = ttk.Treeview(self, columns=self.COLUMNS, show="headings", selectmode="browse")
+        for col, (title, width, anchor) in zip(self.COLUMNS, self.HEADINGS):
+            self.tree.heading(col, text=title)
+            self.tree.column(col, width=width, anchor=anchor)
+        self.scroll = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.scroll.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        self.tree.bind("<Configure>", lambda e: self._resize(e.height))
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll_by(-3 if e.delta > 0 else 3))
+        self.tree.bind("<Button-4>", lambda e: self.scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_by(3))
+        self.tree.bind("<Prior>", lambda e: self.scroll_by(-self._visible))
+        self.tree.bind("<Next>", lambda e: self.scroll_by(self._visible))
+        self.tree.bind("<Home>", lambda e: self.scroll_to(0))
+        self.tree.bind("<End>", lambda e: self.scroll_to(len(self._source)))
+
+    @property
+    def source(self) -> Sequence[Any]:
+        return self._source
+
+    def set_source(self, records: Sequence[Any], keep_position: bool = False) -> None:
+        self._source = records
+        if not keep_position:
+            self._offset = 0
+        self.refresh()
+
+    def refresh(self) -> None:
+        self._offset = max(0, min(self._offset, len(self._source) - self._visible))
+        self._render()
+
+    def scroll_by(self, rows: int) -> str:
+        self.scroll_to(self._offset + rows)
+        return "break"
+
+    def scroll_to(self, offset: int) -> None:
+        self._offset = offset
+        self.refresh()
+        self._maybe_load_more()
+
+    def _row_height(self) -> int:
+        try:
+            return int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        except (tk.TclError, ValueError):
+            return 20
+
+    def _resize(self, height: int) -> None:
+        visible = max(1, (height - self.HEADER_HEIGHT) // self._row_height())
+        if visible != self._visible:
+            self._visible = visible
+            self.refresh()
+            self._maybe_load_more()
+
+    def _on_scrollbar(self, *args: str) -> None:
+        total = len(self._source)
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * total))
+        elif args[0] == "scroll":
+            step = int(args[1]) * (self._visible if args[2] == "pages" else 1)
+            self.scroll_by(step)
+
+    def _values(self, r: Any) -> Tuple[Any, ...]:
+        return (r.id if r.id is not None else "…", r.log_type, r.log_message, r.hostname, str(r.created_at))
+
+    def _render(self) -> None:
+        window = self._source[self._offset:self._offset + self._visible]
+        for i, r in enumerate(window):
+            values = self._values(r)
+            if i < len(self._items):
+                if self._rendered[i] != values:
+                    self.tree.item(self._items[i], values=values)
+                    self._rendered[i] = values
+            else:
+                self._items.append(self.tree.insert("", "end", values=values))
+                self._rendered.append(values)
+        stale = self._items[len(window):]
+        if stale:
+            self.tree.delete(*stale)
+            del self._items[len(window):]
+            del self._rendered[len(window):]
+
+        total = len(self._source)
+        if total:
+            self.scroll.set(self._offset / total, min(1.0, (self._offset + len(window)) / total))
+        else:
+            self.scroll.set(0.0, 1.0)
+
+    def _maybe_load_more(self) -> None:
+        if self.on_need_more is None or self._loading:
+            return
+        if self._offset + self._visible * (1 + self.PREFETCH_PAGES) < len(self._source):
+            return
+        self._loading = True
+        try:
+            self.on_need_more()
+        finally:
+            self._loading = False
+
+class VirtualStatsView(VirtualLogView):
+    COLUMNS = ("bucket", "type", "host", "count")
+    HEADINGS = (("Bucket (UTC)", 200, "w"), ("Type", 120, "w"), ("Host", 240, "w"), ("Count", 120, "w"))
+
+    def _values(self, r: Any) -> Tuple[Any, ...]:
+        return (f"{r['bucket'].astimezone(timezone.utc):%Y-%m-%d %H:%M}", r.get("log_type", "-"), r.get("hostname", "-"), r["count"])